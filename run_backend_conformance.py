@@ -0,0 +1,149 @@
+import argparse
+import difflib
+import glob
+import json
+import logging
+import os
+import sys
+import tempfile
+from collections import Counter
+
+from src.synthetic_invoices import generate_corpus
+from src.etl_processor import InvoiceProcessor
+from src.profiling import StageProfiler
+from src.text_backends import DEFAULT_BACKEND, available_backends
+from run_benchmark import measure
+from run_extraction_benchmark import agreement
+
+# Conformidade e vazão dos backends de extração de texto (src/text_backends.py) contra o
+# pdfplumber, a referência:
+# - linhas: cada página passa pelo mesmo caminho do motor (despacho de layout + extract
+#   do layout, com a divisão de colunas) e o texto é comparado linha a linha
+# - resultado: lançamentos extraídos e validação de process_pdf iguais aos da referência
+# - vazão: process_pdf completo (arquivos/s, páginas/s, p50/p99)
+# Sai com código 1 quando um backend fica abaixo de --min-line-match.
+
+MAX_DIFFS_SHOWN = 5
+
+
+def page_lines(processor, path):
+    """Lines of every page exactly as the engine extracts them (layout dispatch + column split)."""
+    with processor.backend.open(path) as pdf:
+        if not pdf.pages:
+            return []
+        parser = processor.layouts.dispatch(pdf.pages[0])
+        texts = parser.extract(processor, pdf, StageProfiler())
+    return [str(t).split("\n") for t in texts]
+
+
+def line_conformance(lines, reference):
+    """(identical pages, pages, reference lines also produced by the backend, reference lines, sample diffs)."""
+    same_pages = pages = matched = total = 0
+    diffs = []
+    for path, ref_pages in reference.items():
+        got_pages = lines[path]
+        pages += max(len(ref_pages), len(got_pages))
+        for i, ref in enumerate(ref_pages):
+            got = got_pages[i] if i < len(got_pages) else []
+            same_pages += ref == got
+            matched += sum((Counter(ref) & Counter(got)).values())
+            total += len(ref)
+            if ref != got and len(diffs) < MAX_DIFFS_SHOWN:
+                diff = list(difflib.unified_diff(ref, got, lineterm="", n=0))[2:8]
+                diffs.append(f"{os.path.basename(path)} página {i + 1}:\n    " + "\n    ".join(diff))
+    return same_pages, pages, matched, total, diffs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Conformidade (linha a linha) e vazão dos backends de extração de texto")
+    parser.add_argument("--files", type=int, default=8, help="faturas sintéticas por layout")
+    parser.add_argument("--layouts", default="itau,generic", help="layouts sintéticos, separados por vírgula")
+    parser.add_argument("--pdf-dir", default=None, help="usar os PDFs deste diretório em vez do corpus sintético")
+    parser.add_argument("--backends", default=None, help="backends a comparar (padrão: todos os disponíveis)")
+    parser.add_argument("--extraction", default="text", choices=InvoiceProcessor.EXTRACTION_MODES, help="modo de extração")
+    parser.add_argument("--min-line-match", type=float, default=0.99,
+                        help="fração mínima das linhas da referência que cada backend precisa reproduzir")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--corpus-dir", default=None, help="diretório do corpus (padrão: temporário)")
+    parser.add_argument("--json", default=None, help="salvar resultados em JSON neste caminho")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.pdf_dir:
+        paths = sorted(glob.glob(os.path.join(args.pdf_dir, "*.pdf")))
+    else:
+        corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix="faturas_backends_")
+        paths = []
+        for layout in [l.strip() for l in args.layouts.split(",") if l.strip()]:
+            paths += [m["caminho"] for m in generate_corpus(corpus_dir, n_files=args.files, seed=args.seed, layout=layout)]
+    if not paths:
+        print("Nenhum PDF para processar")
+        return 2
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()] if args.backends else available_backends()
+    if DEFAULT_BACKEND not in backends:
+        backends.insert(0, DEFAULT_BACKEND)
+
+    lines, outputs, results = {}, {}, []
+    for name in backends:
+        processor = InvoiceProcessor(extraction=args.extraction, backend=name)
+        lines[name] = {path: page_lines(processor, path) for path in paths}
+        pages = sum(len(p) for p in lines[name].values())
+        outputs[name] = {}
+
+        def run_one(path, processor=processor, out=outputs[name]):
+            out[path] = processor.process_pdf(path)
+
+        result = measure(name, run_one, paths, 1, pages, max(1, args.repeat), track_memory=False)
+        ok = sum(1 for _, s in outputs[name].values() if s.get("validacao", {}).get("status") == "OK")
+        result["validacao_ok"] = f"{ok}/{len(paths)}"
+        results.append(result)
+    print(f"Corpus: {len(paths)} arquivos, {sum(len(p) for p in lines[DEFAULT_BACKEND].values())} páginas\n")
+
+    reference_speed = results[0]["arquivos_por_seg"]
+    failures = []
+    for result in results:
+        name = result["modo"]
+        result["aceleracao"] = result["arquivos_por_seg"] / reference_speed if reference_speed else 0.0
+        if name == DEFAULT_BACKEND:
+            continue
+        same_pages, pages, matched, total, diffs = line_conformance(lines[name], lines[DEFAULT_BACKEND])
+        same_files, rows_matched, rows_total = agreement(outputs[name], outputs[DEFAULT_BACKEND])
+        result["paginas_iguais"] = f"{same_pages}/{pages}"
+        result["linhas_iguais"] = f"{matched}/{total}"
+        result["arquivos_iguais"] = f"{same_files}/{len(paths)}"
+        result["lancamentos_iguais"] = f"{rows_matched}/{rows_total}"
+        result["diferencas"] = diffs
+        share = matched / total if total else 1.0
+        if share < args.min_line_match:
+            failures.append(f"{name}: {share:.1%} das linhas iguais à referência (mínimo {args.min_line_match:.0%})")
+
+    header = (f"{'backend':<12} {'arq/s':>7} {'pág/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'acel.':>6} "
+              f"{'valid. OK':>10} {'páginas':>9} {'linhas':>11} {'lançamentos':>12}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['modo']:<12} {r['arquivos_por_seg']:>7.2f} {r['paginas_por_seg']:>7.1f} {r['p50_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['aceleracao']:>5.1f}x {r['validacao_ok']:>10} {r.get('paginas_iguais', 'ref.'):>9} "
+              f"{r.get('linhas_iguais', 'ref.'):>11} {r.get('lancamentos_iguais', 'ref.'):>12}")
+    for r in results:
+        for diff in r.get("diferencas", []):
+            print(f"\n{r['modo']} x {DEFAULT_BACKEND}, {diff}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "resultados": results}, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados salvos em: {args.json}")
+
+    print()
+    for f in failures:
+        print(f"❌ {f}")
+    print("OK" if not failures else f"{len(failures)} backends fora da conformidade")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from src.synthetic_invoices import generate_corpus
+from src.etl_processor import InvoiceProcessor, process_files_to_df
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile (no interpolation), good enough for latency reporting."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def measure(name, run_one, items, files_per_item, pages_per_item, repeat=1, track_memory=True):
+    """
+    Runs `run_one` over every item `repeat` times and collects throughput and latency.
+    Peak memory is measured in a separate pass, since tracemalloc slows down the timed run.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            t0 = time.perf_counter()
+            run_one(item)
+            latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    peak_mb = None
+    if track_memory:
+        tracemalloc.start()
+        for item in items:
+            run_one(item)
+        peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+    total_files = files_per_item * len(items) * repeat
+    total_pages = pages_per_item * repeat
+    return {
+        "modo": name,
+        "arquivos": total_files,
+        "paginas": total_pages,
+        "segundos": elapsed,
+        "arquivos_por_seg": total_files / elapsed if elapsed else 0.0,
+        "paginas_por_seg": total_pages / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "pico_memoria_mb": peak_mb,
+    }
+
+
+def bench_process_pdf(manifest, repeat, track_memory):
+    processor = InvoiceProcessor()
+    paths = [m["caminho"] for m in manifest]
+    pages = sum(m["paginas"] for m in manifest)
+    stage_totals = {}
+    profiled_runs = []
+
+    def run_one(path):
+        _, summary = processor.process_pdf(path)
+        if tracemalloc.is_tracing():
+            # A passada de memória é bem mais lenta; não entra na média das etapas
+            return
+        profile = summary.get("profile") or {}
+        for stage, ms in profile.get("stages_ms", {}).items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + ms
+        profiled_runs.append(1)
+
+    result = measure("process_pdf", run_one, paths, 1, pages, repeat, track_memory)
+    # Média por arquivo de cada etapa
+    result["etapas_ms"] = {k: v / len(profiled_runs) for k, v in stage_totals.items()} if profiled_runs else {}
+    return result
+
+
+def bench_batch(manifest, repeat, track_memory):
+    paths = [m["caminho"] for m in manifest]
+    pages = sum(m["paginas"] for m in manifest)
+    # Um item = um lote completo; a latência reportada é por lote
+    return measure("batch", process_files_to_df, [paths], len(paths), pages, repeat, track_memory)
+
+
+def bench_api(manifest, repeat, track_memory):
+    try:
+        from fastapi.testclient import TestClient
+        from src.api import app
+    except Exception as e:
+        logging.warning(f"API benchmark indisponível ({e}); instale as dependências do TestClient para habilitar")
+        return None
+
+    client = TestClient(app)
+
+    def post(path):
+        with open(path, "rb") as f:
+            response = client.post("/api/extract", files={"file": (os.path.basename(path), f, "application/pdf")})
+        response.raise_for_status()
+
+    paths = [m["caminho"] for m in manifest]
+    pages = sum(m["paginas"] for m in manifest)
+    return measure("api", post, paths, 1, pages, repeat, track_memory)
+
+
+def print_results(results):
+    header = f"{'modo':<12} {'arquivos':>8} {'pág.':>6} {'arq/s':>8} {'pág/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'pico MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        peak = f"{r['pico_memoria_mb']:.1f}" if r["pico_memoria_mb"] is not None else "-"
+        print(f"{r['modo']:<12} {r['arquivos']:>8} {r['paginas']:>6} {r['arquivos_por_seg']:>8.2f} {r['paginas_por_seg']:>8.2f} "
+              f"{r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f} {peak:>8}")
+    for r in results:
+        if r.get("etapas_ms"):
+            print(f"\nEtapas de {r['modo']} (média ms por arquivo):")
+            for stage, ms in sorted(r["etapas_ms"].items(), key=lambda kv: -kv[1]):
+                print(f"  {stage:<22} {ms:>9.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do ETL de faturas com corpus sintético no layout Itaú")
+    parser.add_argument("--files", type=int, default=10, help="quantidade de faturas sintéticas")
+    parser.add_argument("--cards", type=int, default=3, help="blocos de cartão (final dddd) por fatura")
+    parser.add_argument("--transactions", type=int, default=40, help="lançamentos por cartão")
+    parser.add_argument("--summary-pages", type=int, default=1, help="páginas de resumo/simulação por fatura")
+    parser.add_argument("--no-international", action="store_true", help="não gerar seção internacional")
+    parser.add_argument("--no-installments", action="store_true", help="não gerar compras parceladas")
+    parser.add_argument("--layout", default="itau", choices=["itau", "generic"], help="layout das faturas sintéticas")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=1, help="repetições de cada modo")
+    parser.add_argument("--modes", default="process_pdf,batch,api", help="modos separados por vírgula")
+    parser.add_argument("--corpus-dir", default=None, help="diretório do corpus (padrão: temporário)")
+    parser.add_argument("--no-memory", action="store_true", help="pular a medição de pico de memória")
+    parser.add_argument("--json", default=None, help="salvar resultados em JSON neste caminho")
+    args = parser.parse_args(argv)
+
+    # Logs INFO por arquivo distorcem a medição; mantém apenas avisos
+    logging.getLogger().setLevel(logging.WARNING)
+
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix="faturas_bench_")
+    manifest = generate_corpus(
+        corpus_dir,
+        n_files=args.files,
+        seed=args.seed,
+        layout=args.layout,
+        cards=args.cards,
+        transactions_per_card=args.transactions,
+        international=not args.no_international,
+        installments=not args.no_installments,
+        summary_pages=args.summary_pages,
+    )
+    print(f"Corpus: {len(manifest)} arquivos, {sum(m['paginas'] for m in manifest)} páginas em {corpus_dir}\n")
+
+    benches = {"process_pdf": bench_process_pdf, "batch": bench_batch, "api": bench_api}
+    results = []
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        if mode not in benches:
+            print(f"Modo desconhecido: {mode}")
+            return 2
+        result = benches[mode](manifest, args.repeat, not args.no_memory)
+        if result:
+            results.append(result)
+
+    print_results(results)
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "resultados": results}, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados salvos em: {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
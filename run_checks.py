@@ -0,0 +1,149 @@
+import logging
+import os
+import sys
+import tempfile
+
+import pandas as pd
+import pdfplumber
+
+from src.dedup import DuplicateDetector
+from src.etl_processor import InvoiceProcessor
+from src.ocr_cache import page_content_hash
+from src.store import TransactionStore
+from src.synthetic_invoices import TOP_Y, LEADING, write_pdf, write_pdf_objects
+
+# Verificações de regressão de casos pontuais que o corpus do run_golden.py não cobre
+# (cada uma monta a própria entrada). Sai com código 1 se alguma falhar.
+
+
+def _stream(body: bytes, extra: bytes = b"") -> bytes:
+    return b"<< /Length %d " % len(body) + extra + b">>\nstream\n" + body + b"\nendstream"
+
+
+def check_ocr_hash_nested_images(tmp_dir):
+    """Two scanned pages whose images differ only inside an identical Form XObject wrapper get different OCR cache keys."""
+    objects = [(1, b"<< /Type /Catalog /Pages 2 0 R >>"), (2, b"<< /Type /Pages /Kids [3 0 R 7 0 R] /Count 2 >>")]
+    for page_id, pixel in ((3, b"\x00"), (7, b"\xff")):
+        content, form, image = page_id + 1, page_id + 2, page_id + 3
+        objects += [
+            (page_id, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 100 100] /Resources << /XObject << /Fm0 %d 0 R >> >> /Contents %d 0 R >>" % (form, content)),
+            (content, _stream(b"q /Fm0 Do Q")),
+            (form, _stream(b"q 100 0 0 100 0 0 cm /Im0 Do Q",
+                           b"/Type /XObject /Subtype /Form /BBox [0 0 100 100] /Resources << /XObject << /Im0 %d 0 R >> >> " % image)),
+            (image, _stream(pixel, b"/Type /XObject /Subtype /Image /Width 1 /Height 1 /ColorSpace /DeviceGray /BitsPerComponent 8 ")),
+        ]
+    path = os.path.join(tmp_dir, "scan_forms.pdf")
+    write_pdf_objects(path, sorted(objects))
+    with pdfplumber.open(path) as pdf:
+        first, second = (page_content_hash(p) for p in pdf.pages)
+    assert first != second, "páginas com imagens diferentes dentro do mesmo Form XObject têm o mesmo hash"
+
+
+def check_generic_header_collision(tmp_dir):
+    """Two different generic invoices with the same due date and total are not flagged as duplicates."""
+    detector = DuplicateDetector(InvoiceProcessor())
+    for i, (holder, rows) in enumerate((
+        ("Ana Souza", [("03/02 MERCADO CENTRAL", "100,00"), ("05/02 POSTO SHELL", "50,00")]),
+        ("Bruno Lima", [("07/02 FARMACIA PACHECO", "120,00"), ("09/02 PADARIA REAL", "30,00")]),
+    )):
+        lines = ["Banco Exemplo S.A. - Fatura do cartão de crédito", f"Olá, {holder}",
+                 "Valor total R$ 150,00", "Vencimento: 15/02/2025", "Data Descrição Valor (R$)"]
+        items = [(40, TOP_Y - n * LEADING, text) for n, text in enumerate(lines)]
+        for n, (text, amount) in enumerate(rows, start=len(lines)):
+            items += [(40, TOP_Y - n * LEADING, text), (470, TOP_Y - n * LEADING, amount)]
+        path = os.path.join(tmp_dir, f"generica_{i}.pdf")
+        write_pdf(path, [items])
+        original, fingerprint = detector.check(path, os.path.basename(path))
+        assert original is None, f"{os.path.basename(path)} tratada como duplicata de {original} ({fingerprint.get('motivo')})"
+        detector.register(os.path.basename(path), fingerprint)
+
+
+def check_installments_across_year_end(tmp_dir):
+    """Installment 11/12 (December invoice) and 12/12 (January invoice) stay one series even when the engine infers different purchase years."""
+    store = TransactionStore(os.path.join(tmp_dir, "parcelas.db"))
+    # Compra em 10/01/2025: na fatura de janeiro/2026 o "10/01" impresso é lido como 2026
+    for arquivo, vencimento, data_compra, parcela in (
+        ("fatura_2025_12.pdf", "23/12/2025", "2025-01-10", "11/12"),
+        ("fatura_2026_01.pdf", "23/01/2026", "2026-01-10", "12/12"),
+    ):
+        df = pd.DataFrame([{
+            "data_vencimento": vencimento, "final_cartao": "1234", "titular_cartao": "ANA SOUZA",
+            "data_transacao": data_compra, "estabelecimento": f"LOJA EXEMPLO {parcela}",
+            "categoria": "Compras", "parcela": parcela, "valor": 100.0, "internacional": False,
+        }])
+        store.replace_file(arquivo, df, {"data_vencimento": vencimento})
+    series = store.installment_series("LOJA EXEMPLO", "2025-01-10", 12)
+    projected = store.projected_installments()
+    store.close()
+    assert [s["numero"] for s in series] == [11, 12], f"série partida: {series}"
+    assert not projected, f"parcelas já quitadas projetadas: {projected}"
+
+
+def check_installment_without_due_date(tmp_dir):
+    """An installment row with no due date and a bare "dd/mm" purchase date is stored (no invoice month) instead of aborting the ingest."""
+    db_path = os.path.join(tmp_dir, "sem_vencimento.db")
+    store = TransactionStore(db_path)
+    df = pd.DataFrame([{
+        "data_vencimento": None, "final_cartao": "1234", "data_transacao": "05/03",
+        "estabelecimento": "LOJA EXEMPLO 02/05", "categoria": "Compras", "parcela": "02/05",
+        "valor": 50.0, "internacional": False,
+    }])
+    try:
+        inserted = store.replace_file("sem_vencimento.pdf", df)
+        series = store.installment_series("LOJA EXEMPLO", "05/03", 5)
+        store.rebuild_installments()
+    except ValueError as e:
+        raise AssertionError(f"ingestão abortada: {e}")
+    finally:
+        store.close()
+    assert inserted == 1, f"{inserted} transações gravadas"
+    assert [(s["numero"], s["mes_fatura"]) for s in series] == [(2, None)], f"série inesperada: {series}"
+
+
+def check_rollup_month_filters_without_date(tmp_dir):
+    """Month filters give the same totals from the rollups and from transacoes when some rows have no date."""
+    store = TransactionStore(os.path.join(tmp_dir, "agregados.db"))
+    df = pd.DataFrame([
+        {"data_transacao": "2025-11-03", "categoria": "Compras", "final_cartao": "1234", "estabelecimento": "LOJA A", "valor": 100.0, "internacional": False},
+        {"data_transacao": "2025-12-10", "categoria": "Compras", "final_cartao": "1234", "estabelecimento": "LOJA B", "valor": 40.0, "internacional": False},
+        {"data_transacao": None, "categoria": "Compras", "final_cartao": "1234", "estabelecimento": "LOJA C", "valor": 7.0, "internacional": False},
+        {"data_transacao": None, "categoria": "Financeiro", "final_cartao": "1234", "estabelecimento": "IOF", "valor": 3.0, "internacional": False},
+    ])
+    store.replace_file("sem_data.pdf", df)
+    try:
+        for filters in ({"mes_fim": "2025-12"}, {"mes_inicio": "2025-12"}, {"mes_inicio": "2025-01", "mes_fim": "2025-12"}):
+            for by in ("categoria", "mes", "cartao"):
+                rollup, _ = store.aggregate(by, filters)
+                # O filtro por arquivo não existe nos agregados: força a leitura de transacoes
+                raw, _ = store.aggregate(by, {**filters, "arquivo": "sem_data.pdf"})
+                assert rollup == raw, f"{by} {filters}: agregados {rollup} x transacoes {raw}"
+    finally:
+        store.close()
+
+
+CHECKS = [
+    check_ocr_hash_nested_images,
+    check_generic_header_collision,
+    check_installments_across_year_end,
+    check_installment_without_due_date,
+    check_rollup_month_filters_without_date,
+]
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    failures = 0
+    with tempfile.TemporaryDirectory(prefix="etl_checks_") as tmp_dir:
+        for check in CHECKS:
+            try:
+                check(tmp_dir)
+                print(f"✅ {check.__name__}")
+            except AssertionError as e:
+                failures += 1
+                print(f"❌ {check.__name__}: {e}")
+    print(f"{len(CHECKS) - failures}/{len(CHECKS)} verificações OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import tempfile
+from collections import Counter
+
+from src.synthetic_invoices import generate_corpus
+from src.etl_processor import InvoiceProcessor
+from run_benchmark import measure
+
+# Compara os modos de extração do motor ("text": extract_text + regexes por linha;
+# "words": extract_words + colunas por coordenada) no mesmo corpus: vazão, tempo das
+# etapas de extração/parse e acurácia (validação contra o total declarado, quantidade
+# de lançamentos esperada no corpus sintético e concordância linha a linha com o modo texto).
+
+REFERENCE_MODE = "text"
+
+
+def rows_of(df):
+    """Extracted rows as hashable tuples (column order independent)."""
+    if df.empty:
+        return []
+    cols = sorted(df.columns)
+    return [tuple(r) for r in df[cols].astype(object).where(df[cols].notna(), None).values.tolist()]
+
+
+def run_mode(mode, paths, pages, expected, repeat):
+    processor = InvoiceProcessor(extraction=mode)
+    outputs, stage_totals, counts = {}, Counter(), Counter()
+
+    def run_one(path):
+        df, summary = processor.process_pdf(path)
+        outputs[path] = (df, summary)
+        profile = summary.get("profile") or {}
+        stage_totals.update(profile.get("stages_ms", {}))
+        counts.update(profile.get("counts", {}))
+
+    result = measure(f"process_pdf[{mode}]", run_one, paths, 1, pages, repeat, track_memory=False)
+    runs = len(paths) * repeat
+    result["etapas_ms"] = {k: v / runs for k, v in stage_totals.items()}
+    result["linhas_via_regex"] = counts.get("word_rows_regex", 0) // repeat
+
+    ok = sum(1 for df, s in outputs.values() if s.get("validacao", {}).get("status") == "OK")
+    result["validacao_ok"] = f"{ok}/{len(paths)}"
+    if expected:
+        # Quantidade exata de lançamentos do gerador; as linhas de ajuste da reconciliação não contam
+        hits = sum(
+            1 for path, (df, _) in outputs.items()
+            if path in expected and not df.empty
+            and int((~df["estabelecimento"].astype(str).str.startswith("RECONCILIATION")).sum()) == expected[path]
+        )
+        result["lancamentos_completos"] = f"{hits}/{len(expected)}"
+    return result, outputs
+
+
+def agreement(outputs, reference):
+    """(identical files, rows present in both, rows in the reference) against the reference mode."""
+    same_files = matched = total = 0
+    for path, (df, _) in reference.items():
+        ref_rows, rows = Counter(rows_of(df)), Counter(rows_of(outputs[path][0]))
+        matched += sum((ref_rows & rows).values())
+        total += sum(ref_rows.values())
+        same_files += ref_rows == rows
+    return same_files, matched, total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vazão e acurácia dos modos de extração (texto x palavras/coordenadas)")
+    parser.add_argument("--files", type=int, default=8, help="faturas sintéticas por layout")
+    parser.add_argument("--layouts", default="itau,generic", help="layouts sintéticos, separados por vírgula")
+    parser.add_argument("--pdf-dir", default=None, help="usar os PDFs deste diretório em vez do corpus sintético")
+    parser.add_argument("--modes", default=",".join(InvoiceProcessor.EXTRACTION_MODES), help="modos de extração")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--corpus-dir", default=None, help="diretório do corpus (padrão: temporário)")
+    parser.add_argument("--json", default=None, help="salvar resultados em JSON neste caminho")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    expected = {}
+    if args.pdf_dir:
+        paths = sorted(glob.glob(os.path.join(args.pdf_dir, "*.pdf")))
+        pages = 0
+    else:
+        corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix="faturas_extracao_")
+        manifest = []
+        for layout in [l.strip() for l in args.layouts.split(",") if l.strip()]:
+            manifest += generate_corpus(corpus_dir, n_files=args.files, seed=args.seed, layout=layout)
+        paths = [m["caminho"] for m in manifest]
+        pages = sum(m["paginas"] for m in manifest)
+        expected = {m["caminho"]: m["transacoes"] for m in manifest}
+    if not paths:
+        print("Nenhum PDF para processar")
+        return 2
+    print(f"Corpus: {len(paths)} arquivos\n")
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    results, outputs = [], {}
+    for mode in modes:
+        result, outputs[mode] = run_mode(mode, paths, pages, expected, max(1, args.repeat))
+        results.append(result)
+
+    reference = outputs.get(REFERENCE_MODE)
+    for result, mode in zip(results, modes):
+        if reference is not None and mode != REFERENCE_MODE:
+            same, matched, total = agreement(outputs[mode], reference)
+            result["arquivos_iguais_ao_texto"] = f"{same}/{len(paths)}"
+            result["linhas_iguais_ao_texto"] = f"{matched}/{total}"
+
+    header = f"{'modo':<22} {'arq/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'extração':>9} {'parse':>7} {'valid. OK':>10} {'completos':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        stages = r["etapas_ms"]
+        extract_ms = stages.get("extract_words", 0.0) + stages.get("extract_page_text", 0.0)
+        print(f"{r['modo']:<22} {r['arquivos_por_seg']:>7.2f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} "
+              f"{extract_ms:>9.1f} {stages.get('line_state_machine', 0.0):>7.2f} {r['validacao_ok']:>10} "
+              f"{r.get('lancamentos_completos', '-'):>10}")
+    for r in results:
+        if "linhas_iguais_ao_texto" in r:
+            print(f"\n{r['modo']}: {r['arquivos_iguais_ao_texto']} arquivos e {r['linhas_iguais_ao_texto']} linhas iguais ao modo texto; "
+                  f"{r['linhas_via_regex']} linhas precisaram dos regexes")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "resultados": results}, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados salvos em: {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import argparse
+import difflib
+import glob
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+
+from src.synthetic_invoices import generate_corpus
+from src.etl_processor import InvoiceProcessor
+
+# Regressão por saídas de referência (golden): cada PDF do corpus passa pelo motor e as
+# linhas extraídas, o resumo e o status de validação são comparados com o JSON gravado em
+# golden/. O tempo de cada arquivo é medido junto, para que otimizações de desempenho só
+# entrem quando a saída continua idêntica.
+
+GOLDEN_DIR = "golden"
+CORPUS_SPEC = "corpus.json"
+TIMINGS_FILE = "tempos.json"
+# Chaves do resumo que variam a cada execução e não entram na comparação
+VOLATILE_SUMMARY_KEYS = ("profile",)
+MAX_DIFF_LINES = 40
+
+
+def plain(value):
+    """JSON-safe copy of a value: numpy scalars become Python numbers, NaN becomes None, floats are rounded."""
+    if isinstance(value, dict):
+        return {str(k): plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        value = value.item()
+    if isinstance(value, float):
+        return None if math.isnan(value) else round(value, 2)
+    return value
+
+
+def snapshot(df, summary):
+    """What is compared for one invoice: rows in extraction order, summary and validation."""
+    summary = {k: v for k, v in summary.items() if k not in VOLATILE_SUMMARY_KEYS}
+    validation = summary.pop("validacao", {})
+    rows = df.astype(object).where(df.notna(), None).values.tolist() if not df.empty else []
+    return {"colunas": list(df.columns), "linhas": plain(rows), "resumo": plain(summary), "validacao": plain(validation)}
+
+
+def build_corpus(spec, corpus_dir):
+    """Regenerates the synthetic corpus described in corpus.json; returns the PDF paths."""
+    paths = []
+    for entry in spec["sintetico"]:
+        params = dict(entry)
+        manifest = generate_corpus(
+            corpus_dir, n_files=params.pop("arquivos"), seed=params.pop("seed"), layout=params.pop("layout"), **params
+        )
+        paths += [m["caminho"] for m in manifest]
+    return paths
+
+
+def run_corpus(paths, repeat):
+    """Processes every PDF; returns ({arquivo: snapshot}, {arquivo: best time in ms})."""
+    processor = InvoiceProcessor()
+    results, timings = {}, {}
+    for path in paths:
+        name = os.path.basename(path)
+        best = None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            df, summary = processor.process_pdf(path)
+            elapsed = (time.perf_counter() - t0) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = snapshot(df, summary)
+        timings[name] = round(best, 1)
+    processor.close()
+    return results, timings
+
+
+def golden_path(golden_dir, name):
+    return os.path.join(golden_dir, os.path.splitext(name)[0] + ".json")
+
+
+def load_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def dump_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1, ensure_ascii=False, sort_keys=True)
+        f.write("\n")
+
+
+def dump_snapshot(path, snap):
+    # Uma linha extraída por linha do arquivo: o diff do git mostra exatamente quais transações mudaram
+    rows = ",\n".join("  " + json.dumps(r, ensure_ascii=False) for r in snap["linhas"])
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{\n")
+        for key in ("colunas", "resumo", "validacao"):
+            f.write(f' "{key}": {json.dumps(snap[key], ensure_ascii=False, sort_keys=True)},\n')
+        f.write(f' "linhas": [\n{rows}\n ]\n}}\n' if rows else ' "linhas": []\n}\n')
+
+
+def diff_snapshot(expected, actual):
+    """Human-readable differences between two snapshots (empty list when identical)."""
+    problems = []
+    ev, av = expected.get("validacao", {}), actual.get("validacao", {})
+    if ev.get("status") != av.get("status"):
+        problems.append(f"validação: {ev.get('status')} -> {av.get('status')}")
+
+    for key in sorted(set(expected["resumo"]) | set(actual["resumo"])):
+        if expected["resumo"].get(key) != actual["resumo"].get(key):
+            problems.append(f"resumo.{key}: {expected['resumo'].get(key)!r} -> {actual['resumo'].get(key)!r}")
+    if ev != av and ev.get("status") == av.get("status"):
+        problems.append(f"validação: {ev} -> {av}")
+
+    if expected.get("colunas") != actual["colunas"]:
+        problems.append(f"colunas: {expected.get('colunas')} -> {actual['colunas']}")
+    exp_rows, act_rows = expected["linhas"], actual["linhas"]
+    if exp_rows != act_rows:
+        problems.append(f"linhas: {len(exp_rows)} esperadas, {len(act_rows)} extraídas")
+        lines = list(difflib.unified_diff(
+            [json.dumps(r, ensure_ascii=False) for r in exp_rows],
+            [json.dumps(r, ensure_ascii=False) for r in act_rows],
+            "golden", "atual", n=0, lineterm="",
+        ))
+        problems += ["  " + l for l in lines[:MAX_DIFF_LINES]]
+        if len(lines) > MAX_DIFF_LINES:
+            problems.append(f"  ... ({len(lines) - MAX_DIFF_LINES} linhas de diff omitidas)")
+    return problems
+
+
+def print_timings(timings, baseline):
+    print(f"\n{'arquivo':<44} {'ms':>9} {'golden ms':>10} {'variação':>9}")
+    total = total_base = 0.0
+    for name, ms in timings.items():
+        base = baseline.get(name)
+        total += ms
+        if base:
+            total_base += base
+            print(f"{name:<44} {ms:>9.1f} {base:>10.1f} {(ms / base - 1) * 100:>8.1f}%")
+        else:
+            print(f"{name:<44} {ms:>9.1f} {'-':>10} {'-':>9}")
+    if total_base:
+        print(f"{'TOTAL':<44} {total:>9.1f} {total_base:>10.1f} {(total / total_base - 1) * 100:>8.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regressão das saídas do ETL contra as referências gravadas (golden)")
+    parser.add_argument("--golden-dir", default=GOLDEN_DIR, help="diretório das saídas de referência")
+    parser.add_argument("--pdf-dir", default=None,
+                        help="usar os PDFs (anonimizados) deste diretório em vez do corpus sintético")
+    parser.add_argument("--corpus-dir", default=None, help="onde gerar o corpus sintético (padrão: temporário)")
+    parser.add_argument("--update", action="store_true", help="regravar as referências com a saída atual")
+    parser.add_argument("--repeat", type=int, default=1, help="execuções por arquivo; o tempo registrado é o melhor")
+    parser.add_argument("--max-slowdown", type=float, default=None,
+                        help="falhar se o tempo total passar de N vezes o tempo das referências (ex: 1.2)")
+    parser.add_argument("--json", default=None, help="salvar diferenças e tempos em JSON neste caminho")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.pdf_dir:
+        paths = sorted(glob.glob(os.path.join(args.pdf_dir, "*.pdf")))
+    else:
+        spec = load_json(os.path.join(args.golden_dir, CORPUS_SPEC))
+        if spec is None:
+            print(f"Especificação do corpus não encontrada: {os.path.join(args.golden_dir, CORPUS_SPEC)}")
+            return 2
+        paths = build_corpus(spec, args.corpus_dir or tempfile.mkdtemp(prefix="faturas_golden_"))
+    if not paths:
+        print("Nenhum PDF para processar")
+        return 2
+    print(f"Corpus: {len(paths)} arquivos")
+
+    results, timings = run_corpus(paths, max(1, args.repeat))
+    timings_path = os.path.join(args.golden_dir, TIMINGS_FILE)
+    baseline = load_json(timings_path, {})
+
+    if args.update:
+        os.makedirs(args.golden_dir, exist_ok=True)
+        for name, snap in results.items():
+            dump_snapshot(golden_path(args.golden_dir, name), snap)
+        dump_json(timings_path, timings)
+        print_timings(timings, baseline)
+        print(f"\nReferências atualizadas em {args.golden_dir}/ ({len(results)} arquivos)")
+        return 0
+
+    failures = {}
+    for name, snap in results.items():
+        expected = load_json(golden_path(args.golden_dir, name))
+        problems = ["sem referência gravada (rode com --update)"] if expected is None else diff_snapshot(expected, snap)
+        if problems:
+            failures[name] = problems
+
+    print_timings(timings, baseline)
+    slow = False
+    if args.max_slowdown and baseline:
+        common = [n for n in timings if n in baseline]
+        ratio = sum(timings[n] for n in common) / max(sum(baseline[n] for n in common), 1e-9)
+        slow = ratio > args.max_slowdown
+        if slow:
+            print(f"\nTempo total {ratio:.2f}x o das referências (limite {args.max_slowdown:.2f}x)")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        dump_json(args.json, {"diferencas": failures, "tempos_ms": timings, "tempos_golden_ms": baseline})
+
+    print()
+    for name, problems in failures.items():
+        print(f"❌ {name}")
+        for p in problems:
+            print(f"   {p}")
+    print(f"{len(results) - len(failures)}/{len(results)} arquivos idênticos às referências")
+    return 1 if failures or slow else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
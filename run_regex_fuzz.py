@@ -0,0 +1,111 @@
+import argparse
+import logging
+import random
+import sys
+import time
+
+from src.etl_processor import InvoiceProcessor
+from src.profiling import StageProfiler
+
+# Fuzz/benchmark dos regexes do parser com linhas adversariais: texto mesclado, sem quebras
+# de linha, com marcadores repetidos e sem o valor que o padrão espera encontrar. Cada linha
+# passa por todos os caminhos que aplicam regex (cabeçalho, máquina de estados do Itaú,
+# extração genérica e reconciliação) e o tempo por linha precisa ficar abaixo do teto.
+# Um padrão com retrocesso super-linear aparece como tempo crescendo mais rápido que o
+# tamanho da linha, o que também é reprovado (--max-growth).
+
+# Abaixo disso o ruído de medição domina a razão entre tamanhos
+MIN_MS_FOR_GROWTH = 5.0
+
+
+def adversarial_lines(size, rng):
+    """(name, line) pairs of about `size` characters each."""
+    def fill(unit):
+        return (unit * (size // len(unit) + 1))[:size]
+
+    words = ["UBER", "TRIP", "PAO", "DE", "ACUCAR", "1234", "XXXX", "R$", "final", "Cartão"]
+    return [
+        ("datas_sem_valor", fill("01/02 ")),
+        ("datas_e_palavras", fill("01/02 LOJA ")),
+        ("iof_sem_valor", fill("IOF TAR ")),
+        ("palavras_sem_data", fill("abc ")),
+        ("digitos_longos", fill("1234567890")),
+        ("digitos_e_pontos", fill("1.234.")),
+        ("valor_incompleto", fill("01/02 X 1.234,5 ")),
+        ("espacos", "01/02" + " " * (size - 5)),
+        ("total_sem_valor", fill("totaldestafatura")),
+        ("total_sua_fatura", fill("O total da sua fatura é: ")),
+        ("saldo_sem_valor", fill("saldofinanciado")),
+        ("saldo_espacado", fill("Saldo Financiado ")),
+        ("encargos_parenteses", fill("Encargos (")),
+        ("pagamento_efetuado", fill("Pagamento efetuado ")),
+        ("repasse_iof", fill("Repasse de IOF ")),
+        ("cartao_final", fill("JOAO final ")),
+        ("cartao_apos_digitos", "01/02 " + fill("1")[: size - 20] + " JOAO final 1234"),
+        ("cartao_apos_datas", fill("01/02 ")[: size - 20] + " JOAO final 1234"),
+        ("total_espacado", "Total" + " " * (size - 5)),
+        ("vencimento_espacado", "Vencimento" + " " * (size - 10)),
+        ("aleatorio", " ".join(rng.choice(words) for _ in range(size // 4))[:size]),
+    ]
+
+
+def paths(processor):
+    """Every code path that runs regexes over a page/line, as (name, fn(line))."""
+    def itau(line):
+        processor.parse_itau_texts(["Lançamentos: compras e saques\n" + line], "fuzz.pdf", StageProfiler())
+
+    def generic(line):
+        header = processor.extract_generic_header(line)
+        processor.extract_generic_transactions([line], "fuzz.pdf", header)
+
+    def reconcile(line):
+        tx = [{"arquivo": "fuzz.pdf", "valor": 10.0, "estabelecimento": "X", "categoria": "Outros"}]
+        header = {"valor_total_declarado": 20.0}
+        processor.reconcile_discrepancies(list(tx), header, [line])
+        header = {"valor_total_declarado": 5.0}
+        processor.reconcile_discrepancies(list(tx), header, [line])
+
+    return [("itau", itau), ("generico", generic), ("reconciliacao", reconcile)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fuzz de regexes com linhas adversariais e teto de tempo por linha")
+    parser.add_argument("--sizes", default="1000,4000,16000", help="tamanhos de linha (caracteres), separados por vírgula")
+    parser.add_argument("--ceiling-ms", type=float, default=100.0, help="tempo máximo por linha e caminho, no maior tamanho")
+    parser.add_argument("--max-growth", type=float, default=2.0,
+                        help="crescimento máximo do tempo entre tamanhos, em múltiplos do crescimento do tamanho")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    processor = InvoiceProcessor()
+    rng = random.Random(args.seed)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    print(f"{'linha':<22} {'caminho':<14} " + " ".join(f"{s:>9}" for s in sizes) + "   (ms)")
+    failures = []
+    for idx in range(len(adversarial_lines(1, rng))):
+        for path_name, fn in paths(processor):
+            row = []
+            for size in sizes:
+                name, line = adversarial_lines(size, rng)[idx]
+                t0 = time.perf_counter()
+                fn(line)
+                ms = (time.perf_counter() - t0) * 1000
+                row.append(ms)
+            print(f"{name:<22} {path_name:<14} " + " ".join(f"{ms:>9.2f}" for ms in row))
+            if row[-1] > args.ceiling_ms:
+                failures.append(f"{name} / {path_name}: {row[-1]:.1f} ms em {sizes[-1]} caracteres (teto {args.ceiling_ms:.0f} ms)")
+            for (s0, t0_ms), (s1, t1_ms) in zip(zip(sizes, row), zip(sizes[1:], row[1:])):
+                if t1_ms > MIN_MS_FOR_GROWTH and t1_ms / max(t0_ms, 1e-3) > args.max_growth * s1 / s0:
+                    failures.append(f"{name} / {path_name}: {t0_ms:.1f} -> {t1_ms:.1f} ms de {s0} para {s1} caracteres (super-linear)")
+
+    print()
+    for f in failures:
+        print(f"❌ {f}")
+    print("OK" if not failures else f"{len(failures)} problemas de tempo")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+
+import pandas as pd
+
+from src.etl_processor import InvoiceProcessor
+from src.page_text_store import PageTextStore, DEFAULT_STORE_PATH
+from run_golden import snapshot, diff_snapshot, dump_snapshot, golden_path, load_json
+
+# Replay dos parsers sobre o cache de texto das páginas: cabeçalho, máquina de estados,
+# categorias, fallback genérico e reconciliação rodam direto do texto gravado, sem abrir
+# nenhum PDF. Fluxo típico para ajustar regras sobre o acervo inteiro:
+#   1. popular o cache uma vez: --populate DIR (ou ETL_PAGE_TEXT_CACHE no lote do run_etl)
+#   2. gravar a saída atual como base: --baseline-dir DIR --update
+#   3. mexer nas regras e repetir o replay com --baseline-dir DIR para ver o que mudou
+
+
+def populate(store, pdf_dir, backend, extraction):
+    """Extracts every PDF of pdf_dir once, saving its page texts in the store."""
+    paths = sorted(glob.glob(os.path.join(pdf_dir, "*.pdf")))
+    processor = InvoiceProcessor(backend=backend, extraction=extraction, page_text_store=store)
+    start = time.perf_counter()
+    for path in paths:
+        processor.process_pdf(path)
+    elapsed = time.perf_counter() - start
+    print(f"Cache populado: {len(paths)} PDFs em {elapsed:.1f}s ({processor.backend.name}, modo {extraction})")
+    return len(paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay dos parsers a partir do cache de texto das páginas")
+    parser.add_argument("--store", default=os.getenv("ETL_PAGE_TEXT_CACHE") or DEFAULT_STORE_PATH,
+                        help="arquivo do cache de texto das páginas")
+    parser.add_argument("--populate", default=None, metavar="PDF_DIR", help="extrair os PDFs deste diretório para o cache antes do replay")
+    parser.add_argument("--backend", default=None, help="backend de extração usado em --populate (padrão: ETL_TEXT_BACKEND)")
+    parser.add_argument("--extraction", default="text", choices=InvoiceProcessor.EXTRACTION_MODES, help="modo de extração em --populate")
+    parser.add_argument("--files", default=None, help="só estes arquivos do cache, separados por vírgula")
+    parser.add_argument("--baseline-dir", default=None, help="comparar cada fatura com a saída gravada neste diretório")
+    parser.add_argument("--update", action="store_true", help="regravar a saída de --baseline-dir com o replay atual")
+    parser.add_argument("--csv", default=None, help="salvar as transações consolidadas neste CSV")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    store = PageTextStore(args.store)
+    if args.populate:
+        populate(store, args.populate, args.backend, args.extraction)
+
+    arquivos = [f.strip() for f in args.files.split(",") if f.strip()] if args.files else None
+    processor = InvoiceProcessor()
+    results, frames = {}, []
+    ok = rows = 0
+    load_s = parse_s = 0.0
+    start = time.perf_counter()
+    entries = store.entries(arquivos)
+    while True:
+        t0 = time.perf_counter()
+        entry = next(entries, None)
+        load_s += time.perf_counter() - t0
+        if entry is None:
+            break
+        t0 = time.perf_counter()
+        df, summary = processor.replay_page_texts(entry["arquivo"], entry["layout"], entry["page_texts"])
+        parse_s += time.perf_counter() - t0
+        results[entry["arquivo"]] = snapshot(df, summary)
+        ok += summary.get("validacao", {}).get("status") == "OK"
+        rows += len(df)
+        frames.append(df)
+    elapsed = time.perf_counter() - start
+    if not results:
+        print(f"Cache vazio: {args.store} (rode com --populate DIR ou ETL_PAGE_TEXT_CACHE no lote)")
+        return 2
+
+    stats = store.stats()
+    ratio = stats["bytes_comprimidos"] / max(stats["caracteres_texto"], 1)
+    print(f"Cache: {stats['arquivos']} arquivos, {stats['paginas']} páginas, "
+          f"{stats['bytes_comprimidos'] / 1024:.1f} KB comprimidos ({ratio:.0%} do texto)")
+    print(f"Replay: {len(results)} arquivos em {elapsed:.2f}s ({len(results) / elapsed:.1f} arq/s; "
+          f"leitura do cache {load_s * 1000:.0f} ms, parse {parse_s * 1000:.0f} ms)")
+    print(f"{rows} transações, validação OK em {ok}/{len(results)}")
+
+    if args.csv:
+        pd.concat(frames, ignore_index=True).to_csv(args.csv, index=False)
+        print(f"Transações salvas em: {args.csv}")
+
+    status = 0
+    if args.baseline_dir:
+        if args.update:
+            os.makedirs(args.baseline_dir, exist_ok=True)
+            for name, snap in results.items():
+                dump_snapshot(golden_path(args.baseline_dir, name), snap)
+            print(f"Base atualizada em {args.baseline_dir}/ ({len(results)} arquivos)")
+        else:
+            changed = {}
+            for name, snap in results.items():
+                expected = load_json(golden_path(args.baseline_dir, name))
+                problems = ["sem saída na base (rode com --update)"] if expected is None else diff_snapshot(expected, snap)
+                if problems:
+                    changed[name] = problems
+            print()
+            for name, problems in changed.items():
+                print(f"❌ {name}")
+                for p in problems:
+                    print(f"   {p}")
+            print(f"{len(results) - len(changed)}/{len(results)} arquivos iguais à base")
+            status = 1 if changed else 0
+    store.close()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
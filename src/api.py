@@ -1,13 +1,22 @@
 import os
+import hashlib
+import json
 import logging
+import queue
 import shutil
 import tempfile
-from fastapi import FastAPI, UploadFile, File, Request, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+import threading
+from typing import Optional
+from fastapi import FastAPI, UploadFile, File, Request, HTTPException, Query
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import pandas as pd
 from src.etl_processor import InvoiceProcessor
+from src.metrics import REGISTRY, EXTRACTION_METRICS, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from src.store import TransactionStore, DEFAULT_DB_PATH
+from src.dedup import DuplicateDetector
 
 # Configuração de logs
 logging.basicConfig(level=logging.INFO)
@@ -22,6 +31,30 @@ templates = Jinja2Templates(directory="src/templates")
 UPLOAD_DIR = "temp_uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# ETL_PROFILE_LOG=1 emite o perfil por etapa de cada extração como log estruturado (JSON)
+LOG_PROFILE = os.getenv("ETL_PROFILE_LOG", "0") == "1"
+
+# Base consolidada: cada extração é gravada nela e as consultas históricas leem dela
+STORE = TransactionStore(os.getenv("ETL_DB_PATH", DEFAULT_DB_PATH))
+# Faturas já gravadas (mesmo conteúdo ou mesmo cartão + vencimento + total) são servidas da base, sem parse
+DETECTOR = DuplicateDetector(InvoiceProcessor(), STORE)
+
+# Campos do evento "cabecalho" de /api/extract/stream
+HEADER_FIELDS = ("valor_total_declarado", "data_emissao", "data_vencimento", "nome_cliente", "cartao_principal")
+
+@app.middleware("http")
+async def count_requests(request: Request, call_next):
+    response = await call_next(request)
+    # Usa o template da rota (não a URL crua) para não explodir a cardinalidade dos labels
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    EXTRACTION_METRICS.requests.inc(path=path, status=str(response.status_code))
+    return response
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
@@ -30,113 +63,308 @@ async def read_root(request: Request):
 async def read_info(request: Request):
     return templates.TemplateResponse("docs.html", {"request": request})
 
+def _extract_upload(temp_file_path: str, filename: str, on_page=None, on_header=None):
+    """
+    Duplicate check, parsing (or the stored rows of a duplicate) and persistence of an
+    uploaded PDF: (df, summary, duplicada_de). on_page/on_header feed the streaming endpoint.
+    """
+    duplicate_of, fingerprint = DETECTOR.check(temp_file_path, filename)
+    df = STORE.read_dataframe(duplicate_of) if duplicate_of else pd.DataFrame()
+    if duplicate_of and not df.empty:
+        logger.info(f"{filename} duplica {duplicate_of} (por {fingerprint['motivo']}); respondendo da base")
+        EXTRACTION_METRICS.duplicates.inc(motivo=fingerprint["motivo"])
+        summary = STORE.invoice(duplicate_of) or {}
+        if on_header is not None:
+            on_header(summary)
+    else:
+        duplicate_of = None
+        # Processar
+        processor = InvoiceProcessor(log_profile=LOG_PROFILE, on_page=on_page)
+        if on_header is not None and fingerprint.get("cabecalho"):
+            # Cabeçalho já lido da primeira página pelo detector: sai antes do parse do documento inteiro
+            on_header(fingerprint["cabecalho"])
+        df, summary = processor.process_pdf(temp_file_path)
+
+    if df.empty:
+        EXTRACTION_METRICS.failures.inc()
+        raise HTTPException(status_code=500, detail="Falha ao processar PDF ou arquivo vazio")
+
+    if not duplicate_of:
+        try:
+            STORE.replace_file(filename, df, {**summary, **fingerprint})
+        except Exception as e:
+            logger.warning(f"Falha ao gravar {filename} na base consolidada: {e}")
+    return df, summary, duplicate_of
+
+def _extraction_response(filename: str, df: pd.DataFrame, summary: dict, duplicate_of: Optional[str]) -> dict:
+    """Body of /api/extract: dashboard statistics, validation, transactions and profile."""
+    # Reconstruct validation logic
+    total_declarado = summary.get('valor_total_declarado', 0.0)
+    total_extraido = df['valor'].sum()
+    diff = total_declarado - total_extraido
+    status = "OK" if abs(diff) < 1.0 else "DIVERGENTE"
+    EXTRACTION_METRICS.observe_extraction(summary.get("profile"), status)
+
+    # Check for Saldo Financiado/Discounts
+    discount_note = ""
+    if not df.empty:
+        saldo_tx = df[df['estabelecimento'].str.contains("Saldo Financiado|Saldo Anterior", case=False, na=False)]
+        if not saldo_tx.empty:
+            saldo_val = saldo_tx['valor'].sum()
+            if saldo_val < 0:
+                discount_note = f" (Incl. Desc/Saldo: {saldo_val:.2f})"
+
+    validation = {
+        "total_declarado": total_declarado,
+        "total_extraido": total_extraido,
+        "diff": diff,
+        "status": status,
+        "discount_note": discount_note
+    }
+
+    # Converter NaN para None para JSON válido
+    df_dict = df.astype(object).where(pd.notnull(df), None).to_dict(orient='records')
+
+    # Estatísticas para o dashboard
+
+    # Convertendo colunas relevantes para numérico se necessário
+    df['valor'] = pd.to_numeric(df['valor'], errors='coerce').fillna(0.0)
+
+    # Cálculos específicos
+    # IOF
+    iof_mask = df['estabelecimento'].str.contains('IOF', case=False, na=False)
+    total_iof = df[iof_mask]['valor'].sum()
+
+    # Internacional (excluindo IOF se quiser separar, mas aqui vamos pegar tudo marcado como internacional)
+    total_internacional = df[df['internacional'] == True]['valor'].sum()
+
+    # Taxas e Juros (Multa, Juros, Encargos, Anuidade)
+    taxas_mask = df['estabelecimento'].str.contains('MULTA|JUROS|ENCARGOS|ANUIDADE', case=False, regex=True, na=False)
+    total_taxas_servicos = df[taxas_mask]['valor'].sum()
+
+    # Net spend (transactions only, excluding taxes and IOF)
+    total_compras = df[~taxas_mask & ~iof_mask]['valor'].sum()
+
+    # Compras Parceladas (se parcela não for nulo)
+    total_parcelado = df[df['parcela'].notna()]['valor'].sum()
+
+    # Determinar método de extração
+    extraction_method = "NATIVO ITAÚ"
+    if 'extraction_method' in df.columns and not df.empty:
+            if "Generic" in df['extraction_method'].values:
+                extraction_method = "GENÉRICO / OUTRO BANCO"
+
+    stats = {
+        "total_declarado": validation['total_declarado'],
+        "total_extraido": validation['total_extraido'],
+        "total_compras": float(total_compras),
+        "diferenca": validation['diff'],
+        "status": validation['status'],
+        "discount_note": validation.get('discount_note', ""),
+        "total_transacoes": len(df),
+        "total_iof": float(total_iof),
+        "total_internacional": float(total_internacional),
+        "total_taxas": float(total_taxas_servicos),
+        "total_parcelado": float(total_parcelado),
+        "por_categoria": df.groupby('categoria')['valor'].sum().to_dict(),
+        "por_titular": df.groupby('titular_cartao')['valor'].sum().to_dict(),
+        "metodo_extracao": extraction_method
+    }
+
+    return {
+        "filename": filename,
+        "statistics": stats,
+        "transactions": df_dict,
+        "raw_validation": validation,
+        "profile": summary.get("profile"),
+        "duplicada_de": duplicate_of
+    }
+
+def _save_upload(file: UploadFile) -> str:
+    """
+    Copies an upload to a directory of its own under UPLOAD_DIR and returns the PDF path.
+    The client's file name is kept (process_pdf takes arquivo from it), but uploads with
+    the same name running at the same time no longer overwrite each other's file.
+    """
+    upload_dir = tempfile.mkdtemp(dir=UPLOAD_DIR)
+    path = os.path.join(upload_dir, os.path.basename(file.filename))
+    try:
+        with open(path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+    except Exception:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        raise
+    return path
+
+def _discard_upload(temp_file_path: str):
+    """Removes an upload saved by _save_upload, with its directory."""
+    shutil.rmtree(os.path.dirname(temp_file_path), ignore_errors=True)
+
 @app.post("/api/extract")
 async def extract_invoice(file: UploadFile = File(...)):
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Arquivo deve ser um PDF")
 
-    temp_file_path = os.path.join(UPLOAD_DIR, file.filename)
+    temp_file_path = None
+    EXTRACTION_METRICS.in_progress.inc()
     
     try:
         # Salvar arquivo temporariamente
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        temp_file_path = _save_upload(file)
             
-        # Processar
-        processor = InvoiceProcessor()
-        df, summary = processor.process_pdf(temp_file_path)
-        
-        if df.empty:
-            raise HTTPException(status_code=500, detail="Falha ao processar PDF ou arquivo vazio")
-            
-        # Reconstruct validation logic
-        total_declarado = summary.get('valor_total_declarado', 0.0)
-        total_extraido = df['valor'].sum()
-        diff = total_declarado - total_extraido
-        status = "OK" if abs(diff) < 1.0 else "DIVERGENTE"
-
-        # Check for Saldo Financiado/Discounts
-        discount_note = ""
-        if not df.empty:
-            saldo_tx = df[df['estabelecimento'].str.contains("Saldo Financiado|Saldo Anterior", case=False, na=False)]
-            if not saldo_tx.empty:
-                saldo_val = saldo_tx['valor'].sum()
-                if saldo_val < 0:
-                    discount_note = f" (Incl. Desc/Saldo: {saldo_val:.2f})"
-
-        validation = {
-            "total_declarado": total_declarado,
-            "total_extraido": total_extraido,
-            "diff": diff,
-            "status": status,
-            "discount_note": discount_note
-        }
-        
-        # Converter NaN para None para JSON válido
-        df_dict = df.where(pd.notnull(df), None).to_dict(orient='records')
-        
-        # Estatísticas para o dashboard
-        
-        # Convertendo colunas relevantes para numérico se necessário
-        df['valor'] = pd.to_numeric(df['valor'], errors='coerce').fillna(0.0)
-        
-        # Cálculos específicos
-        # IOF
-        iof_mask = df['estabelecimento'].str.contains('IOF', case=False, na=False)
-        total_iof = df[iof_mask]['valor'].sum()
-        
-        # Internacional (excluindo IOF se quiser separar, mas aqui vamos pegar tudo marcado como internacional)
-        total_internacional = df[df['internacional'] == True]['valor'].sum()
-        
-        # Taxas e Juros (Multa, Juros, Encargos, Anuidade)
-        taxas_mask = df['estabelecimento'].str.contains('MULTA|JUROS|ENCARGOS|ANUIDADE', case=False, regex=True, na=False)
-        total_taxas_servicos = df[taxas_mask]['valor'].sum()
-        
-        # Net spend (transactions only, excluding taxes and IOF)
-        total_compras = df[~taxas_mask & ~iof_mask]['valor'].sum()
-        
-        # Compras Parceladas (se parcela não for nulo)
-        total_parcelado = df[df['parcela'].notna()]['valor'].sum()
-
-        # Determinar método de extração
-        extraction_method = "NATIVO ITAÚ"
-        if 'extraction_method' in df.columns and not df.empty:
-                if "Generic" in df['extraction_method'].values:
-                    extraction_method = "GENÉRICO / OUTRO BANCO"
-
-        stats = {
-            "total_declarado": validation['total_declarado'],
-            "total_extraido": validation['total_extraido'],
-            "total_compras": float(total_compras),
-            "diferenca": validation['diff'],
-            "status": validation['status'],
-            "discount_note": validation.get('discount_note', ""),
-            "total_transacoes": len(df),
-            "total_iof": float(total_iof),
-            "total_internacional": float(total_internacional),
-            "total_taxas": float(total_taxas_servicos),
-            "total_parcelado": float(total_parcelado),
-            "por_categoria": df.groupby('categoria')['valor'].sum().to_dict(),
-            "por_titular": df.groupby('titular_cartao')['valor'].sum().to_dict(),
-            "metodo_extracao": extraction_method
-        }
-        
-        response_data = {
-            "filename": file.filename,
-            "statistics": stats,
-            "transactions": df_dict,
-            "raw_validation": validation
-        }
-        
-        return JSONResponse(content=response_data)
+        # Parse bloqueante fora do event loop: requisições concorrentes extraem em paralelo
+        # (e o gauge in_progress passa a refletir as que estão na fila do pool)
+        df, summary, duplicate_of = await run_in_threadpool(_extract_upload, temp_file_path, file.filename)
+        return JSONResponse(content=_extraction_response(file.filename, df, summary, duplicate_of))
 
+    except HTTPException:
+        raise
     except Exception as e:
+        EXTRACTION_METRICS.failures.inc()
         logger.error(f"Erro ao processar arquivo: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
+        EXTRACTION_METRICS.in_progress.dec()
         # Limpar arquivo temporário
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+        if temp_file_path:
+            _discard_upload(temp_file_path)
+
+def _ndjson(event: dict) -> bytes:
+    return (json.dumps(event, ensure_ascii=False, allow_nan=False, default=str) + "\n").encode("utf-8")
+
+def _card_blocks(transactions: list):
+    """Transactions grouped by (titular_cartao, final_cartao), blocks in order of first appearance."""
+    blocks = {}
+    for t in transactions:
+        blocks.setdefault((t.get("titular_cartao"), t.get("final_cartao")), []).append(t)
+    return blocks.items()
+
+def _start_extraction(filename: str, temp_file_path: str) -> queue.Queue:
+    """
+    Starts the extraction of an uploaded PDF in a worker thread and returns the queue its
+    events are pushed into (None marks the end). The worker owns the in_progress gauge and
+    the temp file, so both are released even if the client never reads the stream.
+    """
+    events = queue.Queue()
+
+    def emit(evento, **data):
+        events.put({"evento": evento, **data})
+
+    def work():
+        try:
+            df, summary, duplicate_of = _extract_upload(
+                temp_file_path, filename,
+                on_page=lambda pagina, total: emit("pagina", pagina=pagina, total=total),
+                on_header=lambda header: emit("cabecalho", **{k: header.get(k) for k in HEADER_FIELDS}),
+            )
+            response_data = _extraction_response(filename, df, summary, duplicate_of)
+            for (titular, final), transactions in _card_blocks(response_data.pop("transactions")):
+                emit("transacoes", titular_cartao=titular, final_cartao=final, transactions=transactions)
+            emit("resumo", cabecalho={k: summary.get(k) for k in HEADER_FIELDS}, **response_data)
+        except HTTPException as e:
+            emit("erro", detail=e.detail)
+        except Exception as e:
+            EXTRACTION_METRICS.failures.inc()
+            logger.error(f"Erro ao processar arquivo: {str(e)}")
+            emit("erro", detail=str(e))
+        finally:
+            EXTRACTION_METRICS.in_progress.dec()
+            _discard_upload(temp_file_path)
+            events.put(None)
+
+    EXTRACTION_METRICS.in_progress.inc()
+    emit("inicio", filename=filename)
+    threading.Thread(target=work, daemon=True).start()
+    return events
+
+def _relay_events(events: queue.Queue):
+    """NDJSON lines of /api/extract/stream, relayed from the worker's queue as they arrive."""
+    while True:
+        event = events.get()
+        if event is None:
+            return
+        yield _ndjson(event)
+
+@app.post("/api/extract/stream")
+async def extract_invoice_stream(file: UploadFile = File(...)):
+    """
+    Streaming variant of /api/extract (application/x-ndjson, one JSON event per line):
+    inicio, cabecalho (first page only), pagina (per extracted page), transacoes (one per
+    card block) and resumo (cabecalho from the full parse, statistics, raw_validation,
+    profile), or erro. The first bytes no longer wait for the whole invoice to be parsed.
+    """
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Arquivo deve ser um PDF")
+
+    try:
+        temp_file_path = _save_upload(file)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    # A extração começa já aqui, não na primeira leitura do corpo da resposta
+    events = _start_extraction(file.filename, temp_file_path)
+    return StreamingResponse(_relay_events(events), media_type="application/x-ndjson")
+
+def _cached_json(request: Request, produce):
+    # ETag = revisão da base + rota + consulta: se nada foi gravado desde a última leitura o cliente recebe 304
+    revision = STORE.revision()
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    etag = '"' + hashlib.sha1(f"{revision}|{request.url.path}|{query}".encode()).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=produce(), headers=headers)
+
+def _history_response(request: Request, by: str, limit: int, offset: int, filters: dict):
+    def produce():
+        items, total = STORE.aggregate(by, filters, limit=limit, offset=offset)
+        return {"items": items, "total": total, "limit": limit, "offset": offset}
+    return _cached_json(request, produce)
+
+def _history_endpoint(by: str):
+    def endpoint(
+        request: Request,
+        limit: int = Query(50, ge=1, le=500),
+        offset: int = Query(0, ge=0),
+        inicio: Optional[str] = Query(None, description="Data inicial (AAAA-MM-DD)"),
+        fim: Optional[str] = Query(None, description="Data final (AAAA-MM-DD)"),
+        mes_inicio: Optional[str] = Query(None, description="Mês inicial (AAAA-MM)"),
+        mes_fim: Optional[str] = Query(None, description="Mês final (AAAA-MM)"),
+        categoria: Optional[str] = None,
+        final_cartao: Optional[str] = None,
+        titular_cartao: Optional[str] = None,
+    ):
+        filters = {
+            "inicio": inicio, "fim": fim, "mes_inicio": mes_inicio, "mes_fim": mes_fim, "categoria": categoria,
+            "final_cartao": final_cartao, "titular_cartao": titular_cartao,
+        }
+        return _history_response(request, by, limit, offset, filters)
+    endpoint.__name__ = f"history_{by}"
+    return endpoint
+
+# Consultas históricas sobre a base consolidada (sem reprocessar PDFs)
+app.get("/api/history/months")(_history_endpoint("mes"))
+app.get("/api/history/categories")(_history_endpoint("categoria"))
+app.get("/api/history/cards")(_history_endpoint("cartao"))
+app.get("/api/history/merchants")(_history_endpoint("estabelecimento"))
+
+@app.get("/api/history/installments")
+def history_installments(request: Request, estabelecimento: str, data_compra: Optional[str] = None,
+                         total_parcelas: int = Query(..., ge=1)):
+    """Parcelas de uma compra ligadas entre faturas (estabelecimento sem o sufixo NN/NN)."""
+    return _cached_json(request, lambda: {
+        "items": STORE.installment_series(estabelecimento, data_compra, total_parcelas)
+    })
+
+@app.get("/api/history/installments/projection")
+def history_installments_projection(request: Request, a_partir: Optional[str] = Query(None, description="Mês inicial (AAAA-MM)")):
+    return _cached_json(request, lambda: {"items": STORE.projected_installments(a_partir)})
+
+@app.get("/api/history/installments/duplicates")
+def history_installments_duplicates(request: Request, limit: int = Query(50, ge=1, le=500), offset: int = Query(0, ge=0)):
+    def produce():
+        items, total = STORE.duplicate_installments(limit=limit, offset=offset)
+        return {"items": items, "total": total, "limit": limit, "offset": offset}
+    return _cached_json(request, produce)
 
 if __name__ == "__main__":
     import uvicorn
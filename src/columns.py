@@ -0,0 +1,106 @@
+from typing import Dict, Hashable, Optional
+
+import numpy as np
+
+# Detecção da divisão entre colunas: em vez de supor que toda página com mais de 500pt
+# tem duas colunas separadas em x=355, cada página tem a cobertura horizontal dos
+# caracteres medida num histograma (NumPy) e a divisão cai no meio do "corredor"
+# vertical em branco mais largo que deixa texto de coluna dos dois lados. Sem corredor
+# plausível, a página é lida inteira, sem divisão.
+# Como todas as páginas de um layout compartilham a geometria, a divisão encontrada fica
+# em cache por impressão digital do layout; as páginas seguintes só conferem que a
+# divisão guardada ainda separa duas colunas (checagem vetorizada, sem o histograma).
+
+# O corredor é procurado só no miolo da página (longe das margens)
+SEARCH_MARGIN = 0.15
+# Corredor: colunas do histograma com no máximo esta fração da cobertura típica do texto,
+# para que títulos e rodapés de largura total não escondam a divisão
+GUTTER_MAX_COVERAGE = 0.1
+MIN_GUTTER_WIDTH = 8.0
+# Cada lado precisa ocupar pelo menos esta fração da largura da página: uma coluna
+# estreita só de valores (ex: layout genérico com o valor em x=470) não é outra coluna
+MIN_COLUMN_SPAN = 0.25
+
+
+def _splits_columns(x0, x1, split: float, width: float) -> bool:
+    """No character straddles split and both sides span like text columns."""
+    left = x1 <= split
+    right = x0 >= split
+    if not left.any() or not right.any() or not (left | right).all():
+        return False
+    min_span = MIN_COLUMN_SPAN * width
+    return x1[left].max() - x0[left].min() >= min_span and x1[right].max() - x0[right].min() >= min_span
+
+
+def _find_split(x0, x1, width: float) -> Optional[float]:
+    # Cobertura por ponto horizontal: quantos caracteres passam por cada coluna de 1pt
+    bins = int(np.ceil(width)) + 1
+    starts = np.clip(np.floor(x0).astype(int), 0, bins - 1)
+    ends = np.clip(np.ceil(x1).astype(int), 0, bins - 1)
+    coverage = np.cumsum(np.bincount(starts, minlength=bins + 1) - np.bincount(ends, minlength=bins + 1))[:bins]
+
+    covered = coverage[coverage > 0]
+    if covered.size == 0:
+        return None
+    empty = coverage <= GUTTER_MAX_COVERAGE * np.percentile(covered, 90)
+
+    lo, hi = int(width * SEARCH_MARGIN), int(width * (1 - SEARCH_MARGIN))
+    window = np.concatenate(([False], empty[lo:hi], [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(window))
+    if edges.size == 0:
+        return None
+    run_starts, run_ends = edges[0::2], edges[1::2]
+
+    # Do corredor mais largo para o mais estreito: o vão entre descrição e valor dentro de
+    # uma coluna também fica em branco, mas deixa de um lado só descrições (lado estreito)
+    min_span = MIN_COLUMN_SPAN * width
+    for i in np.argsort(run_starts - run_ends, kind="stable"):
+        if run_ends[i] - run_starts[i] < MIN_GUTTER_WIDTH:
+            break
+        split = lo + (run_starts[i] + run_ends[i]) / 2.0
+        left = x0 < split
+        if left.all() or not left.any():
+            continue
+        if x1[left].max() - x0[left].min() >= min_span and x1[~left].max() - x0[~left].min() >= min_span:
+            return float(split)
+    return None
+
+
+def find_column_split(x0, x1, width: float) -> Optional[float]:
+    """
+    x coordinate that splits the page into two text columns, or None when the page
+    has a single column. x0/x1 are the character bounds (page.x_bounds() of a
+    src/text_backends.py page).
+    """
+    if len(x0) == 0 or width <= 0:
+        return None
+    return _find_split(x0, x1, width)
+
+
+class ColumnSplitCache:
+    """
+    find_column_split() with a cache per layout fingerprint.
+
+    A cached split is reused while it still splits the page into two columns (no
+    character straddles it, both sides span like columns); otherwise, or when the
+    layout had no split, the page is analysed again and the cache updated.
+    """
+
+    def __init__(self):
+        self._splits: Dict[Hashable, Optional[float]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def split_for(self, page, key: Optional[Hashable] = None) -> Optional[float]:
+        x0, x1 = page.x_bounds()
+        if len(x0) == 0 or page.width <= 0:
+            return None
+        cached = self._splits.get(key) if key is not None else None
+        if cached is not None and _splits_columns(x0, x1, cached, page.width):
+            self.hits += 1
+            return cached
+        self.misses += 1
+        split = _find_split(x0, x1, page.width)
+        if key is not None:
+            self._splits[key] = split
+        return split
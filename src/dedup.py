@@ -0,0 +1,89 @@
+import hashlib
+import logging
+import re
+from typing import Dict, Optional, Tuple
+
+# Detecção de faturas duplicadas antes do parse. Duas impressões digitais, da mais barata
+# para a mais cara:
+#   1. sha256 do arquivo (cópia idêntica com outro nome)
+#   2. chave do cabeçalho: final do cartão + vencimento + total declarado, lida só da
+#      primeira página (a mesma fatura baixada de novo, com bytes diferentes)
+
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def header_key(header_info: Dict) -> Optional[str]:
+    """
+    'final|vencimento|total_centavos', or None when the header lacks card digits, a due
+    date or a total. Without the card (generic layout: cartao_principal "UNKNOWN") due
+    date + total alone would match unrelated invoices, so only the content hash is used.
+    """
+    vencimento = header_info.get("data_vencimento")
+    total = header_info.get("valor_total_declarado") or 0.0
+    digits = re.sub(r"\D", "", header_info.get("cartao_principal") or "")
+    if not digits or not vencimento or not total:
+        return None
+    return f"{digits[-4:]}|{vencimento}|{round(total * 100)}"
+
+
+class DuplicateDetector:
+    """
+    Remembers the fingerprints of accepted invoices (in memory and, when a TransactionStore
+    is given, in its faturas table) and flags new files that match one of them.
+
+    header_reader is an etl_processor.InvoiceProcessor; only its read_header() is used.
+    """
+
+    def __init__(self, header_reader, store=None):
+        self.header_reader = header_reader
+        self.store = store
+        self._by_hash: Dict[str, str] = {}
+        self._by_key: Dict[str, str] = {}
+
+    def _lookup(self, index: Dict[str, str], column: str, value: Optional[str]) -> Optional[str]:
+        if not value:
+            return None
+        found = index.get(value)
+        if found is None and self.store is not None:
+            found = self.store.find_invoice(**{column: value})
+        return found
+
+    def check(self, path: str, arquivo: str) -> Tuple[Optional[str], Dict]:
+        """
+        Returns (original arquivo or None, fingerprint). The fingerprint holds sha256,
+        chave_cabecalho, cabecalho (the first-page header fields, None when not read) and,
+        for duplicates, motivo ("conteudo" or "cabecalho").
+        The header is only read when the content hash is unknown.
+        """
+        fingerprint = {"sha256": file_sha256(path), "chave_cabecalho": None, "cabecalho": None}
+        original = self._lookup(self._by_hash, "sha256", fingerprint["sha256"])
+        if original:
+            fingerprint["motivo"] = "conteudo"
+            return original, fingerprint
+
+        try:
+            # Guardado no fingerprint para quem precisa do cabeçalho não relê a primeira página
+            fingerprint["cabecalho"] = self.header_reader.read_header(path)
+            fingerprint["chave_cabecalho"] = header_key(fingerprint["cabecalho"])
+        except Exception as e:
+            logging.debug(f"Falha ao ler cabeçalho de {arquivo}: {e}")
+        original = self._lookup(self._by_key, "chave_cabecalho", fingerprint["chave_cabecalho"])
+        # Mesmo nome com bytes diferentes é uma versão corrigida do arquivo: reprocessa
+        if original and original != arquivo:
+            fingerprint["motivo"] = "cabecalho"
+            return original, fingerprint
+        return None, fingerprint
+
+    def register(self, arquivo: str, fingerprint: Dict):
+        if fingerprint.get("sha256"):
+            self._by_hash[fingerprint["sha256"]] = arquivo
+        if fingerprint.get("chave_cabecalho"):
+            self._by_key[fingerprint["chave_cabecalho"]] = arquivo
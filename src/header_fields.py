@@ -0,0 +1,107 @@
+import re
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+# Extração do cabeçalho em uma varredura: todos os campos (vencimento, emissão, titular,
+# cartão e os vários padrões de total) viram ramos nomeados de uma única alternância.
+# Cada busca devolve o campo que aparece primeiro no texto; o ramo encontrado sai da
+# alternância e a busca recomeça no mesmo ponto, então a página é percorrida no máximo
+# uma vez por campo, qualquer que seja o padrão de total que vença no fim.
+# O resultado de cada campo é idêntico ao de um re.search isolado do seu padrão.
+
+
+class HeaderScanner:
+    """
+    Finds the first match of several field patterns with a shared scan.
+
+    - fields: (name, pattern) pairs; each pattern has exactly one capturing group,
+      the field value. Inline scoped flags such as (?-i:...) are allowed.
+    - flags: re flags for the combined pattern
+    - lead: optional character class with every possible first character, checked as a
+      lookahead before trying the branches. Only worth it when the branches cannot start
+      with a case-sensitive literal (e.g. IGNORECASE), since then re has no prefix to skip by
+
+    scan(text) returns {name: value} for the fields found; first_of() resolves
+    fields that compete for the same value (e.g. the candidate totals) by priority.
+    """
+
+    def __init__(self, fields: Iterable[Tuple[str, str]], flags: int = 0, lead: Optional[str] = None):
+        self.fields = tuple(fields)
+        self.flags = flags
+        self.lead = lead
+        for name, pattern in self.fields:
+            if re.compile(pattern).groups != 1:
+                raise ValueError(f"Campo {name}: o padrão precisa de exatamente um grupo de captura")
+        # Alternância compilada por conjunto de campos ainda não encontrados
+        self._compiled: Dict[FrozenSet[str], Tuple[re.Pattern, Dict[int, str]]] = {}
+
+    def _regex(self, pending: FrozenSet[str]):
+        entry = self._compiled.get(pending)
+        if entry is None:
+            # Sem grupo envolvendo cada ramo: assim os ramos começam por literal e o re
+            # pula direto para as posições com um primeiro caractere possível
+            patterns = [(name, pattern) for name, pattern in self.fields if name in pending]
+            value_groups = {i + 1: name for i, (name, _) in enumerate(patterns)}
+            pattern = "|".join(p for _, p in patterns)
+            if self.lead:
+                pattern = f"(?={self.lead})(?:{pattern})"
+            entry = self._compiled[pending] = (re.compile(pattern, self.flags), value_groups)
+        return entry
+
+    def scan(self, text: str) -> Dict[str, str]:
+        found: Dict[str, str] = {}
+        pending = frozenset(name for name, _ in self.fields)
+        pos = 0
+        while pending:
+            regex, value_groups = self._regex(pending)
+            m = regex.search(text, pos)
+            if m is None:
+                break
+            name = value_groups[m.lastindex]
+            found[name] = m.group(m.lastindex)
+            pending = pending - {name}
+            # Outro campo pode casar na mesma posição: recomeça nela, sem o ramo encontrado
+            pos = m.start()
+        return found
+
+
+def first_of(found: Dict[str, str], names: Iterable[str]) -> Optional[str]:
+    """Value of the highest-priority field present in found."""
+    for name in names:
+        if name in found:
+            return found[name]
+    return None
+
+
+# Itaú, texto original (com suporte a espaços no valor)
+ITAU_TOTALS = ("total_desta_fatura", "total_sua_fatura")
+ITAU_HEADER = HeaderScanner([
+    ("total_desta_fatura", r'Total\s*desta\s*fatura\s*([\d\.,\s]+)'),
+    ("total_sua_fatura", r'O total da sua fatura é:[\s\S]{0,300}?R\$\s*([\d\.,\s]+)'),
+    ("vencimento", r'Vencimento:\s*(\d{2}/\d{2}/\d{4})'),
+    ("emissao", r'Emissão:\s*(\d{2}/\d{2}/\d{4})'),
+    ("titular", r'Titular\s+(.+)'),
+    ("cartao", r'Cartão\s+(\d{4}\.XXXX\.XXXX\.\d{4})'),
+])
+
+# Itaú, texto normalizado (sem espaços, minúsculo): só varrido se o total não apareceu acima
+ITAU_NORM_TOTALS = (
+    "total_desta_fatura", "total_sua_fatura", "lancamentos_atuais", "lancamentos_atuais_sem_acento",
+    "total_dos_lancamentos_atuais", "total_dos_lancamentos_atuais_sem_acento",
+)
+ITAU_NORM_HEADER = HeaderScanner([
+    ("total_desta_fatura", r'totaldestafatura.{0,300}?([\d\.,]+)'),
+    ("total_sua_fatura", r'ototaldasuafaturaé.{0,300}?r\$\s*([\d\.,]+)'),
+    # Padrões antigos de lançamentos (o "l" opcional antes de "lançamentos" não mudava o valor
+    # capturado; sem ele todos os ramos começam por literal)
+    ("lancamentos_atuais", r'lançamentosatuais\s*([\d\.,]+)'),
+    ("lancamentos_atuais_sem_acento", r'lancamentosatuais\s*([\d\.,]+)'),
+    ("total_dos_lancamentos_atuais", r'totaldoslançamentosatuais\s*([\d\.,]+)'),
+    ("total_dos_lancamentos_atuais_sem_acento", r'totaldoslancamentosatuais\s*([\d\.,]+)'),
+])
+
+GENERIC_HEADER = HeaderScanner([
+    ("total", r'(?:Total|Valor)\s*(?:(?:da\s*fatura|a\s*pagar|total)\s*)?(?:R\$\s*)?([\d\.,]+)'),
+    ("vencimento", r'Vencimento\s*(?::\s*)?(\d{2}/\d{2}/\d{4})'),
+    # Nome com iniciais maiúsculas: este ramo não ignora maiúsculas/minúsculas
+    ("nome", r'(?-i:Olá,\s*([A-Z][a-z]+(?:\s[A-Z][a-z]+)*))'),
+], flags=re.IGNORECASE, lead="[tvo]")
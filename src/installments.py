@@ -0,0 +1,126 @@
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+# Ligação de parcelas entre faturas. Cada compra parcelada é identificada por
+# (estabelecimento normalizado, data da compra, total de parcelas): a parcela 03/10 de uma
+# fatura e a 04/10 da seguinte caem na mesma série. As séries ficam na tabela 'parcelas' do
+# TransactionStore, atualizada junto com a ingestão de cada fatura.
+# A fatura só imprime dia/mês da compra e o motor deduz o ano pelo vencimento, então perto
+# da virada do ano faturas seguidas podem dar anos diferentes para a mesma compra. O ano da
+# chave é refeito a partir do mês da fatura e do número da parcela (anchor_purchase_year).
+
+PARCELA_RE = re.compile(r"^(.*?)\s*(\d{2})/(\d{2})$")
+# data_transacao completa; sem vencimento o motor pode deixar só o "dd/mm" impresso
+ISO_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def normalize_merchant(description: str) -> str:
+    """Uppercase, no accents, only letters/digits and single spaces ('Zig*Casa  Arraiá' -> 'ZIG CASA ARRAIA')."""
+    text = unicodedata.normalize("NFKD", description or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).upper()
+    return " ".join(re.sub(r"[^A-Z0-9]+", " ", text).split())
+
+
+def split_installment(description: str) -> Optional[Tuple[str, int, int]]:
+    """'LOJA X 03/10' -> ('LOJA X', 3, 10); None when the description has no valid NN/NN suffix."""
+    m = PARCELA_RE.match((description or "").strip())
+    if not m:
+        return None
+    numero, total = int(m.group(2)), int(m.group(3))
+    if not 1 <= numero <= total:
+        return None
+    return m.group(1).strip(), numero, total
+
+
+def installment_key(merchant: str, data_compra: Optional[str], total_parcelas: int) -> str:
+    return f"{normalize_merchant(merchant)}|{data_compra or ''}|{int(total_parcelas)}"
+
+
+def anchor_purchase_year(data_compra: Optional[str], mes_fatura: Optional[str], numero: int) -> Optional[str]:
+    """
+    data_compra ('AAAA-MM-DD') with the year that puts the purchase closest to numero months
+    before mes_fatura ('AAAA-MM'), where installment numero is billed. Every invoice of a
+    series implies the same purchase month, whatever year the engine inferred for it.
+    """
+    m = re.match(r"(\d{4})-(\d{2})-(\d{2})$", data_compra or "")
+    if not m or not mes_fatura:
+        return data_compra
+    year, month = int(m.group(1)), int(m.group(2))
+    expected = add_months(mes_fatura, -numero)
+    expected_idx = int(expected[:4]) * 12 + int(expected[5:7]) - 1
+    year = min((year - 1, year, year + 1), key=lambda y: abs(y * 12 + month - 1 - expected_idx))
+    return f"{year:04d}-{m.group(2)}-{m.group(3)}"
+
+
+def add_months(mes: str, n: int) -> str:
+    year, month = int(mes[:4]), int(mes[5:7])
+    idx = year * 12 + (month - 1) + n
+    return f"{idx // 12:04d}-{idx % 12 + 1:02d}"
+
+
+def invoice_month(data_vencimento: Optional[str]) -> Optional[str]:
+    """'23/12/2025' -> '2025-12'."""
+    m = re.match(r"(\d{2})/(\d{2})/(\d{4})$", data_vencimento or "")
+    return f"{m.group(3)}-{m.group(2)}" if m else None
+
+
+def installment_rows(arquivo: str, df: pd.DataFrame) -> List[tuple]:
+    """
+    Rows for the parcelas table from one invoice's transactions:
+    (chave, numero, arquivo, ordem, estabelecimento, data_compra, total_parcelas,
+     final_cartao, mes_fatura, valor_centavos).
+    ordem disambiguates identical installments inside the same invoice.
+    """
+    if df is None or df.empty or "parcela" not in df.columns:
+        return []
+    subset = df[df["parcela"].notna()]
+    rows, seen = [], {}
+    for desc, data_compra, venc, final, valor in subset.reindex(
+        columns=["estabelecimento", "data_transacao", "data_vencimento", "final_cartao", "valor"]
+    ).itertuples(index=False, name=None):
+        parts = split_installment(desc)
+        if not parts:
+            continue
+        merchant, numero, total = parts
+        data_compra = data_compra if isinstance(data_compra, str) else None
+        mes = invoice_month(venc if isinstance(venc, str) else None)
+        if mes is None:
+            # Sem vencimento: a parcela N costuma cair N meses após a compra (só com o ano conhecido)
+            if data_compra and ISO_DATE_RE.match(data_compra):
+                mes = add_months(data_compra[:7], numero)
+        else:
+            data_compra = anchor_purchase_year(data_compra, mes, numero)
+        chave = installment_key(merchant, data_compra, total)
+        ordem = seen.get((chave, numero), 0)
+        seen[(chave, numero)] = ordem + 1
+        rows.append((
+            chave, numero, arquivo, ordem, normalize_merchant(merchant), data_compra, total,
+            final if isinstance(final, str) else None, mes, int(round(float(valor) * 100)),
+        ))
+    return rows
+
+
+def project_outflows(last_seen: Iterable[tuple], a_partir: Optional[str] = None) -> List[Dict]:
+    """
+    Future installments not yet billed, summed per month.
+    last_seen holds, per series, (numero, total_parcelas, mes_fatura, valor_centavos) of the
+    latest installment seen; the remaining ones are projected one per month at the same value.
+    """
+    per_month: Dict[str, list] = {}
+    for numero, total, mes, valor_centavos in last_seen:
+        if not mes:
+            continue
+        for k in range(1, total - numero + 1):
+            target = add_months(mes, k)
+            if a_partir and target < a_partir:
+                continue
+            acc = per_month.setdefault(target, [0, 0])
+            acc[0] += valor_centavos
+            acc[1] += 1
+    return [
+        {"mes": mes, "total": round(c / 100.0, 2), "qtd_parcelas": n}
+        for mes, (c, n) in sorted(per_month.items())
+    ]
@@ -0,0 +1,154 @@
+import re
+from typing import Dict, Optional, Tuple
+
+# Registro de layouts de fatura. Cada layout declara uma impressão digital barata
+# (marcadores da primeira página + geometria) e sua própria função de parse. O despacho
+# faz uma única varredura da primeira página e um lookup em dicionário, então registrar
+# novos bancos não encarece o caminho quente do Itaú.
+
+# Páginas mais largas que isso (A4 = 595pt) usam o layout em duas colunas
+TWO_COLUMN_MIN_WIDTH = 500
+
+
+class LayoutParser:
+    """
+    A bank layout: a cheap fingerprint plus a parse function.
+
+    - family: marker family this parser handles (None for the catch-all parser)
+    - markers: regex sources matched against the first page's normalized text
+      (lowercase, no spaces), the same normalization the line state machine uses
+    - two_column: True/False to require the page geometry, None to accept both. On
+      extraction, False reads pages whole; otherwise the column split is detected per
+      page (src/columns.py) and may be no split at all
+
+    Parsing is split in two steps so the processor can post-process the text (OCR)
+    in between:
+    - extract(processor, pdf, profiler) returns the text of every page of the open
+      document (src/text_backends.py, whichever backend the processor uses), in page order
+    - parse_texts(processor, page_texts, filename, profiler) runs the layout's rules over
+      those texts and returns (transactions, header_info)
+    """
+
+    name = "base"
+    family: Optional[str] = None
+    markers: Tuple[str, ...] = ()
+    two_column: Optional[bool] = None
+
+    def extract(self, processor, pdf, profiler):
+        raise NotImplementedError
+
+    def parse_texts(self, processor, page_texts, filename, profiler):
+        raise NotImplementedError
+
+    def parse(self, processor, pdf, filename, profiler):
+        """extract() + parse_texts(); returns (transactions, header_info, page_texts)."""
+        page_texts = self.extract(processor, pdf, profiler)
+        transactions, header_info = self.parse_texts(processor, page_texts, filename, profiler)
+        return transactions, header_info, page_texts
+
+
+ITAU_MARKERS = (
+    r"totaldestafatura", r"ototaldasuafatura", r"lançamentosatuais", r"lancamentosatuais",
+    r"lançamentosnocartão", r"itaú", r"itau", r"\d{4}\.xxxx\.xxxx\.\d{4}",
+)
+
+
+class _ItauParser(LayoutParser):
+    family = "itau"
+    markers = ITAU_MARKERS
+
+    def extract(self, processor, pdf, profiler):
+        return processor.extract_texts(pdf, profiler, two_column=self.two_column, layout=self.name)
+
+    def parse_texts(self, processor, page_texts, filename, profiler):
+        return processor.parse_itau_texts(page_texts, filename, profiler)
+
+
+class ItauClassicParser(_ItauParser):
+    """Itaú invoices laid out in a single column."""
+
+    name = "itau_classic"
+    two_column = False
+
+
+class ItauMastercardParser(_ItauParser):
+    """Itaú Mastercard invoices: A4 pages with two text columns split at the gutter."""
+
+    name = "itau_mastercard"
+    two_column = True
+
+
+class GenericParser(LayoutParser):
+    """Catch-all for other banks: plain text extraction plus the regex-based generic extractor."""
+
+    name = "generic"
+
+    def extract(self, processor, pdf, profiler):
+        with profiler.stage("extract_page_text"):
+            return [processor.extract_page_text(p, i, two_column=False) for i, p in processor.iter_pages(pdf)]
+
+    def parse_texts(self, processor, page_texts, filename, profiler):
+        """Generic extraction over already extracted page texts (also the Itaú fallback)."""
+        profiler.count("generic_parse")
+        with profiler.stage("generic_parse"):
+            header_info = processor.extract_generic_header(page_texts[0] if page_texts else "")
+            transactions = processor.extract_generic_transactions(page_texts, filename, header_info)
+        return transactions, header_info
+
+
+class LayoutRegistry:
+    def __init__(self, default: LayoutParser):
+        self.default = default
+        self._parsers: Dict[str, LayoutParser] = {default.name: default}
+        self._by_fingerprint: Dict[Tuple[Optional[str], Optional[bool]], LayoutParser] = {}
+        self._family_markers: Dict[str, Tuple[str, ...]] = {}
+        self._marker_re = None
+
+    def register(self, parser: LayoutParser) -> LayoutParser:
+        key = (parser.family, parser.two_column)
+        if parser.name in self._parsers or key in self._by_fingerprint:
+            raise ValueError(f"Layout já registrado: {parser.name}")
+        self._parsers[parser.name] = parser
+        self._by_fingerprint[key] = parser
+        if parser.family:
+            markers = self._family_markers.get(parser.family, ())
+            self._family_markers[parser.family] = markers + tuple(m for m in parser.markers if m not in markers)
+            # Uma única regex com um grupo nomeado por família: uma varredura identifica a família
+            self._marker_re = re.compile("|".join(
+                f"(?P<{family}>{'|'.join(ms)})" for family, ms in self._family_markers.items()
+            ))
+        return parser
+
+    def get(self, name: str) -> LayoutParser:
+        return self._parsers[name]
+
+    def fingerprint(self, page) -> Tuple[Optional[str], bool]:
+        """
+        (family, two_column) of a backend page, from the raw chars the backend already
+        parsed, so no text layout is computed here.
+        """
+        family = None
+        if self._marker_re is not None:
+            raw = page.raw_text().replace(" ", "").lower()
+            match = self._marker_re.search(raw)
+            if match:
+                family = match.lastgroup
+        return family, page.width > TWO_COLUMN_MIN_WIDTH
+
+    def dispatch(self, page) -> LayoutParser:
+        family, two_column = self.fingerprint(page)
+        return (
+            self._by_fingerprint.get((family, two_column))
+            or self._by_fingerprint.get((family, None))
+            or self.default
+        )
+
+
+def default_registry() -> LayoutRegistry:
+    registry = LayoutRegistry(default=GenericParser())
+    registry.register(ItauMastercardParser())
+    registry.register(ItauClassicParser())
+    return registry
+
+
+LAYOUTS = default_registry()
@@ -0,0 +1,99 @@
+import re
+from typing import Dict, NamedTuple
+
+# Tokenizador das linhas do layout Itaú. Cada linha é normalizada (sem espaços, minúscula)
+# e varrida uma única vez por um casador combinado com todos os marcadores de seção; o
+# resultado é um LineToken com as flags encontradas, e a máquina de estados de
+# parse_itau_texts decide por elas em vez de repetir dezenas de testes "in" por linha.
+# Os regexes de transação/cartão só rodam quando o token indica que podem casar.
+
+LAUNCHES = 1 << 0        # início de uma lista de lançamentos/transações
+SUMMARY = 1 << 1         # resumo da fatura / demonstrativo de encargos
+PRODUCTS = 1 << 2        # bloco "produtos e serviços"
+IGNORE = 1 << 3          # seções sem lançamentos da fatura atual (opções de pagamento, parcelas futuras...)
+TOTAL = 1 << 4           # "total dos lançamentos atuais"
+INTERNATIONAL = 1 << 5   # cabeçalho (ou descrição) com "internacional"
+IOF_REPASSE = 1 << 6     # "repasse de IOF" em lançamentos internacionais
+CARD = 1 << 7            # "cartão"/"final": possível cabeçalho de bloco de cartão
+
+MARKERS: Dict[str, int] = {
+    "lançamentos": LAUNCHES, "lancamentos": LAUNCHES, "transações": LAUNCHES, "transacoes": LAUNCHES,
+    "minhasdespesas": LAUNCHES,
+    "resumodafatura": SUMMARY, "demonstrativodeencargos": SUMMARY, "resumodespesas": SUMMARY,
+    "produtoseservicos": PRODUCTS, "produtoseserviços": PRODUCTS,
+    "preparamosoutrasopções": IGNORE, "opçõesdepagamento": IGNORE, "pagamentomínimo": IGNORE,
+    "paguesuafatura": IGNORE, "limitesdecrédito": IGNORE, "simulação": IGNORE,
+    "totalparapróximasfaturas": IGNORE, "lançamentosfuturos": IGNORE, "comprasparceladas": IGNORE,
+    "demaisfaturas": IGNORE, "parcelasfuturas": IGNORE,
+    "totaldoslançamentosatuais": IGNORE | TOTAL,
+    "internacional": INTERNATIONAL,
+    "repassedeiof": IOF_REPASSE,
+    "cartão": CARD, "final": CARD,
+}
+
+# Um marcador que contém outro (ex: "lançamentosfuturos" contém "lançamentos") carrega
+# também as flags do menor, já que o casador só reporta o maior em cada posição
+_FLAGS = {m: 0 for m in MARKERS}
+for _m in MARKERS:
+    for _sub, _f in MARKERS.items():
+        if _sub in _m:
+            _FLAGS[_m] |= _f
+
+# Alternância do maior para o menor: em cada posição o marcador mais longo vence
+_MARKER_RE = re.compile("|".join(re.escape(m) for m in sorted(MARKERS, key=len, reverse=True)))
+ENTRY_START_RE = re.compile(r'^\s*(?:\d{2}/\d{2}\b|(?:IOF|TAR)\b)')
+
+# Regexes lineares mesmo em texto mesclado/malformado (ver run_regex_fuzz.py):
+# - a descrição começa e termina em caractere não-espaço (a menor descrição que casa nunca
+#   termina em espaço, então o resultado é o mesmo) e tem no máximo 160 caracteres;
+#   a alternativa vazia preserva o caso "dd/mm   12,34" sem descrição, e só é tentada
+#   quando o valor vem logo após o espaço (senão cada divisão dos espaços seria testada)
+# - "-?\s*valor" virou "-\s*valor|valor": sem o sinal, o \s* disputava os mesmos espaços com o \s+
+IOF_REPASSE_RE = re.compile(r'repassedeiof.{0,160}?(\d{1,3}(?:\.\d{3})*,\d{2})')
+CARD_RE = re.compile(r'(?:cartão|final)\s*(?:xxxx\s*xxxx\s*xxxx\s*)?(\d{4})', re.IGNORECASE)
+TRANSACTION_RE = re.compile(
+    r'(\d{2}/\d{2})\s+(\S(?:.{0,160}?\S)??|(?=\s[-\d]))\s+(-\s*(?:\d{1,3}(?:\.\d{3})*|\d+),\d{2}|(?:\d{1,3}(?:\.\d{3})*|\d+),\d{2})(?!\s*%)'
+)
+IOF_TAR_RE = re.compile(
+    r'((?:IOF|TAR)\s+(?:\S(?:.{0,160}?\S)??|(?=\s[-\d])))\s+(-\s*(?:\d{1,3}(?:\.\d{3})*|\d+),\d{2}|(?:\d{1,3}(?:\.\d{3})*|\d+),\d{2})(?!\s*%)'
+)
+
+
+class LineToken(NamedTuple):
+    """
+    One classified line.
+
+    - flags: OR of the marker flags found in the normalized line
+    - norm: the normalized line (no spaces, lowercase)
+    - total_pos / international_pos: first index of those markers in norm, -1 when absent
+    - starts_entry: the raw line starts with a dd/mm date or IOF/TAR
+    """
+
+    flags: int
+    norm: str
+    total_pos: int
+    international_pos: int
+    starts_entry: bool
+
+    @property
+    def may_have_transaction(self) -> bool:
+        """Cheap pre-check for TRANSACTION_RE (a dd/mm date needs a slash)."""
+        return "/" in self.norm
+
+
+def tokenize(line: str) -> LineToken:
+    norm = line.replace(" ", "").lower()
+    flags = 0
+    total_pos = international_pos = -1
+    search = _MARKER_RE.search
+    m = search(norm)
+    while m is not None:
+        marker = m.group()
+        flags |= _FLAGS[marker]
+        if total_pos < 0 and marker == "totaldoslançamentosatuais":
+            total_pos = m.start()
+        elif international_pos < 0 and marker == "internacional":
+            international_pos = m.start()
+        # Recomeça na posição seguinte ao início (não ao fim): marcadores sobrepostos não se escondem
+        m = search(norm, m.start() + 1)
+    return LineToken(flags, norm, total_pos, international_pos, ENTRY_START_RE.match(line) is not None)
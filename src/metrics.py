@@ -0,0 +1,177 @@
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Métricas em processo no formato de texto do Prometheus (0.0.4), sem dependências externas.
+# Cada atualização é um lookup de dicionário + soma sob um lock, barato o bastante para ficar
+# sempre ligado durante carga.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: labels esperados {self.labelnames}, recebidos {tuple(labels)}")
+        return tuple(labels[n] for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por série: [contagem por bucket (não cumulativa) + overflow, soma, total]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self):
+        lines = []
+        with self._lock:
+            items = [(k, (list(s[0]), s[1], s[2])) for k, s in self._series.items()]
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {n}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica já registrada: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class ExtractionMetrics:
+    """Metrics fed by the extraction pipeline (process_pdf profile + validation outcome)."""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.requests = registry.counter("etl_http_requests_total", "Requisições HTTP por rota e status.", ("path", "status"))
+        self.in_progress = registry.gauge("etl_extractions_in_progress", "Extrações em andamento, incluindo as que aguardam vaga no pool de threads.")
+        self.parse_seconds = registry.histogram("etl_parse_duration_seconds", "Duração total de process_pdf em segundos.")
+        self.stage_seconds = registry.histogram("etl_stage_duration_seconds", "Duração de cada etapa de process_pdf em segundos.", ("stage",))
+        self.pages = registry.counter("etl_pages_processed_total", "Páginas processadas.")
+        self.transactions = registry.counter("etl_transactions_extracted_total", "Transações extraídas.")
+        self.fallbacks = registry.counter("etl_generic_fallback_total", "Faturas de layout específico (Itaú) rejeitadas pelo parser e reextraídas pelo extrator genérico.")
+        self.reconciliation = registry.counter("etl_reconciliation_total", "Resultado da validação declarado x extraído.", ("status",))
+        self.failures = registry.counter("etl_extraction_failures_total", "Extrações que falharam.")
+        self.duplicates = registry.counter("etl_duplicate_invoices_total", "Faturas duplicadas servidas sem parse.", ("motivo",))
+
+    def observe_extraction(self, profile: Optional[Dict], status: Optional[str] = None):
+        if profile:
+            self.parse_seconds.observe(profile.get("total_ms", 0.0) / 1000.0)
+            for stage, ms in profile.get("stages_ms", {}).items():
+                self.stage_seconds.observe(ms / 1000.0, stage=stage)
+            counts = profile.get("counts", {})
+            self.pages.inc(counts.get("pages", 0))
+            self.transactions.inc(counts.get("transactions", 0))
+            if counts.get("generic_fallback"):
+                self.fallbacks.inc()
+        if status:
+            self.reconciliation.inc(status=status)
+
+
+REGISTRY = MetricsRegistry()
+EXTRACTION_METRICS = ExtractionMetrics(REGISTRY)
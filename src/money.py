@@ -0,0 +1,86 @@
+from typing import Iterable, Tuple
+
+import numpy as np
+
+# Conversão em lote de valores no formato brasileiro ("1.234,56", "-12,00", "1 234,56")
+# para float64 ou centavos inteiros, com os valores inválidos sinalizados.
+# Em vez de três str.replace e um float() por valor, a coluna inteira é concatenada num
+# único texto, limpa com três replace sobre ele, dividida de volta e convertida pelo NumPy
+# num só np.array(..., dtype=float) (o parse de cada número roda em C). Só quando o lote
+# tem algum valor inválido os valores são convertidos um a um para sinalizá-los.
+# O resultado é idêntico ao de InvoiceProcessor.parse_money para todo valor válido.
+
+# Separador dos valores no texto concatenado
+_SEP = "\x00"
+# Depois da limpeza só sobram dígitos, o ponto decimal, o sinal e o separador
+_STRAY = str.maketrans("", "", "0123456789.-" + _SEP)
+# Abaixo disso, centavos = rint(valor * 100) é exato para até duas casas decimais
+_FLOAT_CENTS_LIMIT = 1e13
+_MAX_CENTS = 2 ** 63 - 1
+
+
+def _clean(value: str) -> str:
+    return value.replace(" ", "").replace(".", "").replace(",", ".")
+
+
+def _parse_one(value) -> Tuple[float, bool]:
+    """(amount, valid) of a single value, with the same rules as the batch path."""
+    if not isinstance(value, str):
+        return 0.0, False
+    clean = _clean(value)
+    if not clean or clean.translate(_STRAY):
+        return 0.0, False
+    try:
+        return float(clean), True
+    except ValueError:
+        return 0.0, False
+
+
+def _cents_exact(value: str) -> int:
+    """Cents straight from the digits, for amounts too large for rint(float * 100)."""
+    clean = _clean(value)
+    whole, _, frac = clean.lstrip("-").partition(".")
+    if len(frac) > 2:
+        return round(float(clean) * 100)
+    cents = int(whole or "0") * 100 + int(frac.ljust(2, "0"))
+    return -cents if clean.startswith("-") else cents
+
+
+def parse_money_many(values: Iterable[str], cents: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts a column of PT-BR formatted amounts at once.
+
+    Spaces and thousands dots are ignored, the comma is the decimal separator and a
+    minus sign may lead. Returns (amounts, valid): float64 amounts, or int64 cents with
+    cents=True (rounded to the nearest cent), and a bool mask. Invalid entries (no
+    digits, any other character, a second comma or minus, cents beyond int64) are 0
+    with valid False.
+    """
+    values = list(values)
+    amounts = valid = None
+    if all(isinstance(v, str) for v in values):
+        joined = _clean(_SEP.join(values))
+        if joined.count(_SEP) == len(values) - 1 and not joined.translate(_STRAY):
+            try:
+                amounts = np.array(joined.split(_SEP), dtype=float) if values else np.zeros(0)
+                valid = np.ones(len(values), dtype=bool)
+            except ValueError:
+                pass
+    if amounts is None:
+        # Algum valor inválido no lote: um a um, para sinalizar só os inválidos
+        parsed = [_parse_one(v) for v in values]
+        amounts = np.array([a for a, _ in parsed], dtype=float)
+        valid = np.array([ok for _, ok in parsed], dtype=bool)
+
+    if not cents:
+        return amounts, valid
+    result = np.zeros(len(values), dtype=np.int64)
+    small = valid & (np.abs(amounts) < _FLOAT_CENTS_LIMIT)
+    result[small] = np.rint(amounts[small] * 100).astype(np.int64)
+    for i in np.flatnonzero(valid & ~small):
+        exact = _cents_exact(values[i])
+        if abs(exact) <= _MAX_CENTS:
+            result[i] = exact
+        else:
+            valid[i] = False
+    return result, valid
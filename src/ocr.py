@@ -0,0 +1,157 @@
+import logging
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+from src.ocr_cache import OCRCache, page_content_hash, DEFAULT_CACHE_DIR as OCR_CACHE_DIR, DEFAULT_MAX_MB as OCR_CACHE_MAX_MB
+
+# OCR seletivo: só páginas com texto nativo escasso ou ilegível vão para o Tesseract
+OCR_MIN_CHARS = 200        # menos caracteres nativos que isso = página escassa
+OCR_MIN_QUALITY = 0.85     # fração mínima de caracteres legíveis no texto nativo
+OCR_DPI_SCANNED = 300      # página sem nenhum texto nativo (digitalizada)
+OCR_DPI_SPARSE = 200       # página com algum texto nativo; OCR só complementa
+OCR_MAX_WIDTH_PX = 2480    # largura máxima rasterizada (A4 a 300 dpi)
+OCR_MAX_PAGE_GAP = 2       # páginas intermediárias aceitas para juntar chamadas ao poppler
+
+
+def native_text_quality(text):
+    """Fraction of non-space chars that look readable; '(cid:NN)' glyphs count as unreadable."""
+    chars = [c for c in text if not c.isspace()]
+    if not chars:
+        return 0.0
+    good = sum(1 for c in chars if c.isalnum() or c in ".,:;/-*()$%&'\"")
+    unreadable = text.count("(cid:") * len("(cid:00)")
+    return max(0.0, (good - unreadable) / len(chars))
+
+
+def _page_runs(pages, max_gap=OCR_MAX_PAGE_GAP):
+    """Groups sorted page indexes into (first, last) runs, bridging small gaps."""
+    runs = []
+    for p in pages:
+        if runs and p - runs[-1][1] <= max_gap + 1:
+            runs[-1][1] = p
+        else:
+            runs.append([p, p])
+    return [tuple(r) for r in runs]
+
+
+def _ocr_image(args):
+    # Executado nos processos do pool; importa o pytesseract no próprio worker
+    image, lang = args
+    import pytesseract
+    return pytesseract.image_to_string(image, lang=lang)
+
+
+class PageOCR:
+    """
+    OCR hook for InvoiceProcessor: given the native text of every page, OCRs only the
+    sparse/unreadable ones and merges the result back. Optional dependencies
+    (pytesseract, pdf2image and the tesseract binary) are probed once; without them
+    apply() returns the texts unchanged.
+    """
+
+    def __init__(self, workers=None, lang="por+eng", cache_dir=OCR_CACHE_DIR, cache_max_mb=OCR_CACHE_MAX_MB):
+        self.lang = lang
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+        # Cache por página, chaveado pelo hash do conteúdo da página + dpi + idioma:
+        # em memória para a execução atual e em disco (com limite de tamanho) entre execuções
+        self._cache = {}
+        self.disk_cache = OCRCache(cache_dir, cache_max_mb) if cache_dir else None
+
+        self.available = False
+        try:
+            import importlib
+            self.pytesseract = importlib.import_module('pytesseract')
+            self.pdf2image = importlib.import_module('pdf2image')
+            self.PIL_Image = importlib.import_module('PIL.Image')
+            self.available = shutil.which('tesseract') is not None
+            if not self.available:
+                logging.warning('Tesseract não encontrado no PATH; OCR fallback indisponível')
+        except Exception:
+            logging.info('Bibliotecas de OCR não disponíveis; prosseguindo sem OCR')
+
+    def needs_ocr(self, text):
+        return len(text.strip()) < OCR_MIN_CHARS or native_text_quality(text) < OCR_MIN_QUALITY
+
+    def ocr_dpi(self, page_obj, text):
+        # DPI adaptativo: página digitalizada pede mais resolução; páginas grandes são limitadas em pixels
+        dpi = OCR_DPI_SCANNED if not text.strip() else OCR_DPI_SPARSE
+        max_dpi = int(OCR_MAX_WIDTH_PX / (float(page_obj.width) / 72.0))
+        return max(100, min(dpi, max_dpi))
+
+    def merge(self, text, ocr_text):
+        if ocr_text and len(ocr_text.strip()) > len(text.strip()):
+            return ocr_text
+        # Caso OCR seja menor, mescla para capturar tokens perdidos
+        return text + ("\n" + ocr_text if ocr_text else "")
+
+    def _ocr_images(self, images):
+        if len(images) > 1 and self.workers > 1:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return list(self._pool.map(_ocr_image, [(img, self.lang) for img in images]))
+        return [_ocr_image((img, self.lang)) for img in images]
+
+    def ocr_pages(self, pdf_path, requests, pages):
+        """
+        OCRs the requested pages ({page_index: dpi}) of `pages` (pdfplumber pages) and
+        returns {page_index: text}. Pages are rasterized with one poppler call per run of
+        nearby pages (per dpi), and Tesseract runs in a process pool. Results are cached
+        by page content hash + dpi + language, in memory and on disk.
+        """
+        results = {}
+        pending = {}
+        keys = {}
+        for page_index, dpi in requests.items():
+            key = keys[page_index] = OCRCache.key(page_content_hash(pages[page_index]), dpi, self.lang)
+            text = self._cache.get(key)
+            if text is None and self.disk_cache is not None:
+                text = self.disk_cache.get(key)
+            if text is not None:
+                self._cache[key] = results[page_index] = text
+            else:
+                pending[page_index] = dpi
+        if pending:
+            logging.info(f"OCR (cache miss) em {len(pending)} de {len(requests)} páginas selecionadas")
+
+        images = {}
+        for dpi in sorted(set(pending.values())):
+            wanted = sorted(i for i, d in pending.items() if d == dpi)
+            for first, last in _page_runs(wanted):
+                rendered = self.pdf2image.convert_from_path(pdf_path, dpi=dpi, first_page=first + 1, last_page=last + 1)
+                for offset, image in enumerate(rendered):
+                    if pending.get(first + offset) == dpi:
+                        images[first + offset] = image
+
+        order = sorted(images)
+        for page_index, ocr_text in zip(order, self._ocr_images([images[i] for i in order])):
+            self._cache[keys[page_index]] = results[page_index] = ocr_text
+            if self.disk_cache is not None:
+                self.disk_cache.put(keys[page_index], ocr_text)
+        return results
+
+    def apply(self, pdf_path, pages, texts):
+        """Returns the page texts with OCR merged into the sparse/low-quality pages only."""
+        if not self.available:
+            return texts
+        requests = {
+            i: self.ocr_dpi(page, text)
+            for i, (page, text) in enumerate(zip(pages, texts))
+            if self.needs_ocr(text)
+        }
+        if not requests:
+            return texts
+        logging.info(f"OCR em {len(requests)} de {len(texts)} páginas: {[i + 1 for i in sorted(requests)]}")
+        texts = list(texts)
+        try:
+            for page_index, ocr_text in self.ocr_pages(pdf_path, requests, pages).items():
+                texts[page_index] = self.merge(texts[page_index], ocr_text)
+        except Exception as e:
+            logging.debug(f"Falha no OCR de {os.path.basename(pdf_path)}: {str(e)}")
+        return texts
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+from pdfminer.pdftypes import PDFStream, resolve1
+
+# Cache em disco do texto OCR por página. A chave é o hash do conteúdo da página
+# (streams de conteúdo + imagens/XObjects), não o nome do arquivo: a mesma página em um
+# PDF renomeado ou re-baixado reaproveita o OCR. O tamanho total é limitado e os
+# arquivos menos usados recentemente (mtime) são removidos primeiro.
+
+DEFAULT_CACHE_DIR = "build/cache/ocr"
+DEFAULT_MAX_MB = 512
+
+
+def page_content_hash(page) -> str:
+    """
+    sha256 of a pdfplumber page's raw content streams, XObjects (scanned images) and MediaBox.
+    Form XObjects are followed into their own resources, so an image wrapped in a form
+    (common in scanner output) is hashed too. Raw (still encoded) stream bytes are hashed,
+    so nothing is decompressed or rendered.
+    """
+    page_obj = page.page_obj
+    h = hashlib.sha256(repr(tuple(page_obj.mediabox)).encode())
+    for stream in page_obj.contents or []:
+        stream = resolve1(stream)
+        if isinstance(stream, PDFStream):
+            h.update(stream.get_rawdata() or b"")
+    _hash_xobjects(h, page_obj.resources, set())
+    return h.hexdigest()
+
+
+def _hash_xobjects(h, resources, seen: set):
+    """Feeds h with the XObjects of resources, recursing into Form XObjects (each form once)."""
+    xobjects = resolve1((resolve1(resources) or {}).get("XObject")) or {}
+    for name in sorted(xobjects):
+        stream = resolve1(xobjects[name])
+        h.update(str(name).encode())
+        if not isinstance(stream, PDFStream):
+            continue
+        h.update(stream.get_rawdata() or b"")
+        subtype = resolve1(stream.get("Subtype"))
+        if getattr(subtype, "name", subtype) == "Form" and id(stream) not in seen:
+            seen.add(id(stream))
+            # Marca o início/fim do formulário para que o aninhamento entre no hash
+            h.update(b"<form>")
+            _hash_xobjects(h, stream.get("Resources"), seen)
+            h.update(b"</form>")
+
+
+class OCRCache:
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_mb: float = DEFAULT_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def key(page_hash: str, dpi: int, lang: str) -> str:
+        return hashlib.sha256(f"{page_hash}|{dpi}|{lang}".encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        # Subdiretório pelos 2 primeiros caracteres para não acumular milhares de arquivos num só
+        return os.path.join(self.cache_dir, key[:2], key + ".txt")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".txt"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # marca como usado recentemente (LRU por mtime)
+        except OSError:
+            pass
+        return text
+
+    def put(self, key: str, text: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = text.encode("utf-8")
+        try:
+            previous = os.path.getsize(path)
+        except OSError:
+            previous = 0
+        # Escrita atômica: execuções concorrentes nunca leem um arquivo pela metade
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._total_bytes += len(data) - previous
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache is at 90% of its cap."""
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        self._total_bytes = total
+        if removed:
+            logging.info(f"Cache de OCR: {removed} entradas removidas ({total / 1024 / 1024:.1f} MB restantes)")
@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from src.word_table import WordEntry, WordPageText
+
+# Cache intermediário do texto das páginas: o page_texts de cada fatura (depois da divisão
+# de colunas e do OCR, exatamente o que os parsers recebem) fica gravado comprimido (zlib
+# sobre JSON) num único arquivo SQLite, uma linha por arquivo. Com ele, ajustes na máquina
+# de estados, nas categorias ou na reconciliação são reavaliados sobre o acervo inteiro em
+# modo replay (InvoiceProcessor.replay_page_texts / run_replay.py) sem abrir nenhum PDF.
+# Páginas do modo "words" guardam também os lançamentos já lidos das células, então o
+# replay segue o mesmo caminho do processamento original.
+
+DEFAULT_STORE_PATH = "build/cache/page_texts.db"
+COMPRESSION_LEVEL = 9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS paginas (
+    arquivo TEXT PRIMARY KEY,
+    sha256 TEXT,
+    layout TEXT NOT NULL,
+    backend TEXT,
+    extracao TEXT,
+    paginas INTEGER NOT NULL,
+    bytes_texto INTEGER NOT NULL,
+    gravado_em TEXT NOT NULL,
+    dados BLOB NOT NULL
+);
+"""
+
+
+def encode_pages(page_texts: List[str]) -> bytes:
+    """Compressed JSON of the page texts; WordPageText pages keep their row entries."""
+    pages = []
+    for text in page_texts:
+        entries = getattr(text, "entries", None)
+        pages.append({"texto": str(text), "entradas": entries})
+    return zlib.compress(json.dumps(pages, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def decode_pages(data: bytes) -> List[str]:
+    """Inverse of encode_pages()."""
+    page_texts = []
+    for page in json.loads(zlib.decompress(data).decode("utf-8")):
+        entries = page["entradas"]
+        if entries is None:
+            page_texts.append(page["texto"])
+            continue
+        rows = [
+            None if row is None else [WordEntry(start, has_date, tuple(groups), text) for start, has_date, groups, text in row]
+            for row in entries
+        ]
+        page_texts.append(WordPageText(page["texto"].split("\n"), rows))
+    return page_texts
+
+
+class PageTextStore:
+    def __init__(self, db_path: str = DEFAULT_STORE_PATH):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # Mesmo esquema do TransactionStore: uma conexão protegida por lock, WAL para leitores concorrentes
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def put(self, arquivo: str, layout: str, page_texts: List[str], sha256: Optional[str] = None,
+            backend: Optional[str] = None, extraction: Optional[str] = None):
+        """Stores (or replaces) the page texts of one file."""
+        data = encode_pages(page_texts)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO paginas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (arquivo, sha256, layout, backend, extraction, len(page_texts),
+                 sum(len(t) for t in page_texts), datetime.now().isoformat(timespec="seconds"), data),
+            )
+
+    def get(self, arquivo: str) -> Optional[Dict]:
+        """{"arquivo", "layout", "page_texts", ...} of one file, or None."""
+        with self._lock:
+            cur = self.conn.execute("SELECT * FROM paginas WHERE arquivo = ?", (arquivo,))
+            row = cur.fetchone()
+            columns = [d[0] for d in cur.description]
+        return self._entry(dict(zip(columns, row))) if row else None
+
+    def entries(self, arquivos: Optional[Iterable[str]] = None) -> Iterable[Dict]:
+        """Every stored file (or just arquivos), in file order, decompressed one at a time."""
+        names = self.files() if arquivos is None else list(arquivos)
+        for arquivo in names:
+            entry = self.get(arquivo)
+            if entry is None:
+                logging.warning(f"Cache de páginas: {arquivo} não está em {self.db_path}")
+                continue
+            yield entry
+
+    @staticmethod
+    def _entry(row: Dict) -> Dict:
+        row["page_texts"] = decode_pages(row.pop("dados"))
+        return row
+
+    def files(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self.conn.execute("SELECT arquivo FROM paginas ORDER BY arquivo")]
+
+    def stats(self) -> Dict:
+        """Files, pages, raw text size and compressed size held by the store."""
+        with self._lock:
+            files, pages, text, stored = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(paginas), 0), COALESCE(SUM(bytes_texto), 0),"
+                " COALESCE(SUM(LENGTH(dados)), 0) FROM paginas"
+            ).fetchone()
+        return {"arquivos": files, "paginas": pages, "caracteres_texto": text, "bytes_comprimidos": stored}
+
+    def delete(self, arquivo: str):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM paginas WHERE arquivo = ?", (arquivo,))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,53 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class StageProfiler:
+    """
+    Lightweight per-stage timer and counter for process_pdf.
+
+    Durations accumulate per stage name (a stage entered once per page sums all pages),
+    and counters accumulate arbitrary totals such as pages, lines or regex hits.
+    Overhead is one perf_counter pair per stage entry, so it stays on in production.
+    """
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + (time.perf_counter() - t0)
+
+    def add(self, name: str, seconds: float):
+        """Adds an externally measured duration, for loops where a `with` block is awkward."""
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def count(self, name: str, n: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def as_dict(self) -> Dict:
+        """
+        Example:
+            {"total_ms": 310.2,
+             "stages_ms": {"pdf_open": 2.1, "extract_page_text": 250.4, ...},
+             "counts": {"pages": 4, "lines": 290, "regex_hits": 130, "transactions": 126}}
+        """
+        return {
+            "total_ms": round((time.perf_counter() - self._start) * 1000, 3),
+            "stages_ms": {k: round(v * 1000, 3) for k, v in self.durations.items()},
+            "counts": dict(self.counts),
+        }
+
+    def log(self, filename: str, level: int = logging.INFO):
+        """Emits the profile as a single structured (JSON) log line."""
+        payload = {"event": "process_pdf_profile", "arquivo": filename, **self.as_dict()}
+        logging.log(level, json.dumps(payload, ensure_ascii=False))
@@ -0,0 +1,120 @@
+import atexit
+import logging
+import queue
+import threading
+import zlib
+
+# Artefatos auxiliares por fatura (CSV individual e dump Markdown) ficam fora do caminho
+# quente: uma política decide se são gerados e uma thread em segundo plano os escreve
+# com I/O bufferizado.
+
+POLICIES = ("off", "sampled", "on-error", "always")
+WRITE_BUFFER_BYTES = 1 << 16
+
+
+class SideOutputWriter:
+    def __init__(self, policy: str = "on-error", sample_rate: float = 0.1, max_pending: int = 64):
+        if policy not in POLICIES:
+            raise ValueError(f"Política de saída inválida: {policy} (use {', '.join(POLICIES)})")
+        self.policy = policy
+        self.sample_rate = sample_rate
+        # Fila limitada: se o disco não acompanhar, o produtor espera em vez de acumular memória
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def should_write(self, filename: str, status: str) -> bool:
+        if self.policy == "off":
+            return False
+        if self.policy == "always":
+            return True
+        if self.policy == "on-error":
+            return status != "OK"
+        # sampled: amostra determinística pelo nome, estável entre execuções
+        return (zlib.crc32(filename.encode("utf-8")) % 10000) < self.sample_rate * 10000
+
+    def submit(self, fn, *args):
+        """Queues fn(*args) for the writer thread. Arguments must not be mutated afterwards."""
+        self._ensure_thread()
+        self._queue.put((fn, args))
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="side-output-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                fn, args = item
+                fn(*args)
+            except Exception as e:
+                logging.debug(f"Falha ao gravar saída auxiliar: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Blocks until every queued artifact has been written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+
+def write_csv(df, path):
+    with open(path, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER_BYTES) as f:
+        df.to_csv(f, index=False)
+    logging.info(f"Tabela salva em: {path}")
+
+
+def write_invoice_markdown(path, filename, header_info, aux, card_subtotals, df, page_texts):
+    """Markdown dump of one invoice (header, auxiliary totals, transactions and page texts)."""
+    parts = [
+        f"# {filename}\n\n",
+        "## Cabeçalho\n\n",
+        f"- Arquivo: {filename}\n",
+        f"- Data de Emissão: {header_info.get('data_emissao')}\n",
+        f"- Data de Vencimento: {header_info.get('data_vencimento')}\n",
+        f"- Titular: {header_info.get('nome_cliente')}\n",
+        f"- Cartão Principal: {header_info.get('cartao_principal')}\n",
+        f"- Total declarado: {header_info.get('valor_total_declarado'):.2f}\n",
+        "\n## Auxiliares\n\n",
+        f"- Pagamento efetuado (header): {aux['pagamento_efetuado']:.2f}\n",
+        f"- Total 'Produtos e serviços' agregado: {aux['produtos_servicos_total']:.2f}\n",
+        f"- Total 'Outros lançamentos' (resumo): {aux['outros_lanc_total']:.2f}\n",
+        f"- Total transações internacionais (resumo): {aux['intern_trans_total']:.2f}\n",
+        f"- Total lançamentos internacionais (resumo): {aux['intern_lanc_total']:.2f}\n",
+    ]
+    if card_subtotals:
+        parts.append("\n### Subtotais por cartão\n\n")
+        parts.extend(f"- final {k}: {v:.2f}\n" for k, v in card_subtotals.items())
+    parts.append("\n## Transações\n\n")
+    if not df.empty:
+        parts.append("| data | estabelecimento | valor | categoria | final_cartao |\n")
+        parts.append("|---|---|---:|---|---|\n")
+        cols = df.reindex(columns=["data_transacao", "estabelecimento", "valor", "categoria", "final_cartao"])
+        parts.extend(
+            f"| {dt} | {desc} | {valor:.2f} | {cat} | {final} |\n"
+            for dt, desc, valor, cat, final in cols.itertuples(index=False, name=None)
+        )
+    else:
+        parts.append("Sem transações extraídas\n")
+    parts.append("\n## Texto por páginas\n\n")
+    for i, pt in enumerate(page_texts):
+        parts.append(f"### Página {i+1}\n\n```\n{pt}\n```\n\n")
+
+    with open(path, "w", encoding="utf-8", buffering=WRITE_BUFFER_BYTES) as md:
+        md.write("".join(parts))
+    logging.info(f"MD salvo em: {path}")
@@ -0,0 +1,452 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from src.installments import installment_rows, installment_key, project_outflows
+
+# Armazenamento consolidado das transações em SQLite. Schema declarado (em vez de inferido
+# pelo to_sql), modo WAL para leitores concorrentes, inserts em lote numa única transação e
+# substituição idempotente por arquivo: reprocessar uma fatura troca só as linhas dela.
+
+DEFAULT_DB_PATH = "build/db/faturas.db"
+
+TRANSACTION_COLUMNS = (
+    ("arquivo", "TEXT NOT NULL"),
+    ("data_emissao", "TEXT"),
+    ("data_vencimento", "TEXT"),
+    ("valor_total_declarado", "REAL"),
+    ("nome_cliente", "TEXT"),
+    ("cartao_principal", "TEXT"),
+    ("titular_cartao", "TEXT"),
+    ("final_cartao", "TEXT"),
+    ("internacional", "INTEGER"),
+    ("data_transacao", "TEXT"),
+    ("estabelecimento", "TEXT"),
+    ("categoria", "TEXT"),
+    ("parcela", "TEXT"),
+    ("valor", "REAL NOT NULL"),
+)
+COLUMN_NAMES = tuple(name for name, _ in TRANSACTION_COLUMNS)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS transacoes (
+    id INTEGER PRIMARY KEY,
+    {", ".join(f"{name} {decl}" for name, decl in TRANSACTION_COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS idx_transacoes_arquivo ON transacoes (arquivo);
+CREATE INDEX IF NOT EXISTS idx_transacoes_final_cartao ON transacoes (final_cartao);
+CREATE INDEX IF NOT EXISTS idx_transacoes_data ON transacoes (data_transacao);
+CREATE INDEX IF NOT EXISTS idx_transacoes_categoria ON transacoes (categoria);
+
+-- Agregados mensais mantidos incrementalmente na ingestão (chaves NULL gravadas como '')
+CREATE TABLE IF NOT EXISTS resumo_mes_cartao_categoria (
+    mes TEXT NOT NULL,
+    final_cartao TEXT NOT NULL,
+    titular_cartao TEXT NOT NULL,
+    categoria TEXT NOT NULL,
+    total_centavos INTEGER NOT NULL,
+    qtd INTEGER NOT NULL,
+    PRIMARY KEY (mes, final_cartao, titular_cartao, categoria)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS resumo_mes_estabelecimento (
+    mes TEXT NOT NULL,
+    estabelecimento TEXT NOT NULL,
+    total_centavos INTEGER NOT NULL,
+    qtd INTEGER NOT NULL,
+    PRIMARY KEY (mes, estabelecimento)
+) WITHOUT ROWID;
+
+-- Séries de parcelas entre faturas: chave = estabelecimento normalizado | data da compra | total de parcelas
+CREATE TABLE IF NOT EXISTS parcelas (
+    chave TEXT NOT NULL,
+    numero INTEGER NOT NULL,
+    arquivo TEXT NOT NULL,
+    ordem INTEGER NOT NULL,
+    estabelecimento TEXT NOT NULL,
+    data_compra TEXT,
+    total_parcelas INTEGER NOT NULL,
+    final_cartao TEXT,
+    mes_fatura TEXT,
+    valor_centavos INTEGER NOT NULL,
+    PRIMARY KEY (chave, numero, arquivo, ordem)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_parcelas_arquivo ON parcelas (arquivo);
+
+CREATE TABLE IF NOT EXISTS faturas (
+    arquivo TEXT PRIMARY KEY,
+    data_emissao TEXT,
+    data_vencimento TEXT,
+    valor_total_declarado REAL,
+    cartao_principal TEXT,
+    nome_cliente TEXT,
+    qtd_transacoes INTEGER NOT NULL,
+    ingerido_em TEXT NOT NULL,
+    sha256 TEXT,
+    chave_cabecalho TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_faturas_sha256 ON faturas (sha256);
+CREATE INDEX IF NOT EXISTS idx_faturas_chave ON faturas (chave_cabecalho);
+"""
+
+# Dimensões de consulta e sua expressão sobre a tabela transacoes
+DIMENSIONS = {
+    "mes": "substr(data_transacao, 1, 7)",
+    "final_cartao": "final_cartao",
+    "titular_cartao": "titular_cartao",
+    "categoria": "categoria",
+    "estabelecimento": "estabelecimento",
+}
+
+# Tabelas de agregados: nome -> dimensões (na ordem da chave primária)
+ROLLUPS = {
+    "resumo_mes_cartao_categoria": ("mes", "final_cartao", "titular_cartao", "categoria"),
+    "resumo_mes_estabelecimento": ("mes", "estabelecimento"),
+}
+
+# Agrupamentos disponíveis para consultas históricas: chave -> (dimensões, ordenação)
+AGGREGATIONS = {
+    "mes": (("mes",), "mes"),
+    "categoria": (("categoria",), "total DESC, categoria"),
+    "cartao": (("final_cartao", "titular_cartao"), "total DESC, final_cartao"),
+    "estabelecimento": (("estabelecimento",), "total DESC, estabelecimento"),
+}
+
+# Filtros aceitos: nome -> (cláusula sobre transacoes, dimensão/cláusula sobre os agregados ou None)
+FILTERS = {
+    "inicio": ("data_transacao >= ?", None),
+    "fim": ("data_transacao <= ?", None),
+    # Transações sem data ficam fora dos filtros de mês nos dois caminhos (mês '' nos agregados)
+    "mes_inicio": ("NULLIF(substr(data_transacao, 1, 7), '') >= ?", ("mes", "mes <> '' AND mes >= ?")),
+    "mes_fim": ("NULLIF(substr(data_transacao, 1, 7), '') <= ?", ("mes", "mes <> '' AND mes <= ?")),
+    "categoria": ("categoria = ?", ("categoria", "categoria = ?")),
+    "final_cartao": ("final_cartao = ?", ("final_cartao", "final_cartao = ?")),
+    "titular_cartao": ("titular_cartao = ?", ("titular_cartao", "titular_cartao = ?")),
+    "arquivo": ("arquivo = ?", None),
+}
+
+# Versão das chaves da tabela parcelas (PRAGMA user_version); bases mais antigas são
+# reindexadas ao abrir. 1: ano da compra ancorado no mês da fatura (anchor_purchase_year)
+INSTALLMENTS_VERSION = 1
+
+_INSERT_PARCELA_SQL = "INSERT INTO parcelas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+_INSERT_SQL = f"INSERT INTO transacoes ({', '.join(COLUMN_NAMES)}) VALUES ({', '.join('?' * len(COLUMN_NAMES))})"
+
+
+def _rows(df: pd.DataFrame):
+    """DataFrame -> tuples in schema order; NaN/NaT become NULL and missing columns NULL."""
+    frame = df.reindex(columns=list(COLUMN_NAMES)).astype(object)
+    frame = frame.where(pd.notnull(frame), None)
+    return list(frame.itertuples(index=False, name=None))
+
+
+class TransactionStore:
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # Uma conexão por store, protegida por lock: a API usa o mesmo store a partir das threads do servidor
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._writes = 0
+        # Distingue revisões entre reinícios do processo (o contador acima recomeça do zero)
+        self._instance = uuid.uuid4().hex[:8]
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate_legacy_table()
+        self._add_missing_columns()
+        self.conn.executescript(SCHEMA)
+        if self._rollups_missing():
+            self.rebuild_rollups()
+        if self._installments_missing() or self._user_version() < INSTALLMENTS_VERSION:
+            self.rebuild_installments()
+
+    def _migrate_legacy_table(self):
+        """Bases antigas tinham 'transacoes' criada pelo to_sql (sem schema); copia as linhas para o schema declarado."""
+        existing = [r[1] for r in self.conn.execute("PRAGMA table_info(transacoes)")]
+        if not existing or "id" in existing:
+            return
+        common = [c for c in COLUMN_NAMES if c in existing]
+        with self.conn:
+            self.conn.execute("ALTER TABLE transacoes RENAME TO transacoes_legado")
+            self.conn.executescript(SCHEMA)
+            if "arquivo" in common and "valor" in common:
+                cols = ", ".join(common)
+                self.conn.execute(f"INSERT INTO transacoes ({cols}) SELECT {cols} FROM transacoes_legado")
+            self.conn.execute("DROP TABLE transacoes_legado")
+        logging.info(f"Store: tabela legada migrada para o schema declarado ({self.db_path})")
+
+    def _add_missing_columns(self):
+        # Colunas adicionadas depois da criação da tabela faturas (impressão digital e cliente)
+        existing = [r[1] for r in self.conn.execute("PRAGMA table_info(faturas)")]
+        if existing:
+            for column in ("sha256", "chave_cabecalho", "nome_cliente"):
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE faturas ADD COLUMN {column} TEXT")
+            if "nome_cliente" not in existing:
+                # Faturas já gravadas: o cliente está repetido em cada transação
+                with self.conn:
+                    self.conn.execute(
+                        "UPDATE faturas SET nome_cliente = (SELECT t.nome_cliente FROM transacoes t"
+                        " WHERE t.arquivo = faturas.arquivo AND t.nome_cliente IS NOT NULL LIMIT 1)"
+                    )
+
+    def _rollups_missing(self) -> bool:
+        has_rows = self.conn.execute("SELECT 1 FROM transacoes LIMIT 1").fetchone()
+        has_rollup = self.conn.execute("SELECT 1 FROM resumo_mes_cartao_categoria LIMIT 1").fetchone()
+        return bool(has_rows) and not has_rollup
+
+    def _user_version(self) -> int:
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def _installments_missing(self) -> bool:
+        has_rows = self.conn.execute("SELECT 1 FROM transacoes WHERE parcela IS NOT NULL LIMIT 1").fetchone()
+        has_index = self.conn.execute("SELECT 1 FROM parcelas LIMIT 1").fetchone()
+        return bool(has_rows) and not has_index
+
+    def rebuild_installments(self):
+        """Recomputes the parcelas table from transacoes (used for bases created before it)."""
+        df = pd.read_sql_query(
+            "SELECT arquivo, data_vencimento, data_transacao, estabelecimento, parcela, final_cartao, valor"
+            " FROM transacoes WHERE parcela IS NOT NULL", self.conn,
+        )
+        with self.conn:
+            self.conn.execute("DELETE FROM parcelas")
+            for arquivo, group in df.groupby("arquivo", sort=False):
+                self.conn.executemany(_INSERT_PARCELA_SQL, installment_rows(arquivo, group))
+            self.conn.execute(f"PRAGMA user_version = {INSTALLMENTS_VERSION}")
+            self._writes += 1
+        logging.info(f"Store: índice de parcelas recalculado ({self.db_path})")
+
+    def _apply_rollups(self, arquivo: str, sign: int):
+        """
+        Adds (sign=1) or subtracts (sign=-1) one file's transactions to every rollup table.
+        Runs inside the caller's transaction; amounts are summed in integer cents so that
+        replacing a file restores the exact previous totals.
+        """
+        for table, dims in ROLLUPS.items():
+            exprs = ", ".join(f"COALESCE({DIMENSIONS[d]}, '')" for d in dims)
+            self.conn.execute(
+                f"INSERT INTO {table} ({', '.join(dims)}, total_centavos, qtd)"
+                f" SELECT {exprs}, {sign} * SUM(CAST(ROUND(valor * 100) AS INTEGER)), {sign} * COUNT(*)"
+                f" FROM transacoes WHERE arquivo = ? GROUP BY {exprs}"
+                f" ON CONFLICT ({', '.join(dims)}) DO UPDATE SET"
+                f" total_centavos = total_centavos + excluded.total_centavos, qtd = qtd + excluded.qtd",
+                (arquivo,),
+            )
+            self.conn.execute(f"DELETE FROM {table} WHERE qtd = 0")
+
+    def rebuild_rollups(self):
+        """Recomputes every rollup table from transacoes (used for bases created before the rollups)."""
+        with self.conn:
+            for table, dims in ROLLUPS.items():
+                exprs = ", ".join(f"COALESCE({DIMENSIONS[d]}, '')" for d in dims)
+                self.conn.execute(f"DELETE FROM {table}")
+                self.conn.execute(
+                    f"INSERT INTO {table} ({', '.join(dims)}, total_centavos, qtd)"
+                    f" SELECT {exprs}, SUM(CAST(ROUND(valor * 100) AS INTEGER)), COUNT(*)"
+                    f" FROM transacoes GROUP BY {exprs}"
+                )
+            self._writes += 1
+        logging.info(f"Store: agregados mensais recalculados ({self.db_path})")
+
+    def replace_file(self, arquivo: str, df: pd.DataFrame, metadata: Optional[Dict] = None) -> int:
+        return self.replace_files({arquivo: (df, metadata)})
+
+    def replace_files(self, frames: Dict[str, tuple]) -> int:
+        """
+        Replaces the rows of each file in a single transaction.
+        frames maps arquivo -> (DataFrame, header metadata or None); an empty DataFrame
+        just clears the file. Returns the number of inserted rows.
+        """
+        inserted = 0
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._lock, self.conn:
+            for arquivo, (df, metadata) in frames.items():
+                self._apply_rollups(arquivo, -1)
+                self.conn.execute("DELETE FROM transacoes WHERE arquivo = ?", (arquivo,))
+                self.conn.execute("DELETE FROM parcelas WHERE arquivo = ?", (arquivo,))
+                rows = []
+                if df is not None and not df.empty:
+                    df = df.assign(arquivo=arquivo)
+                    rows = _rows(df)
+                    self.conn.executemany(_INSERT_SQL, rows)
+                    self._apply_rollups(arquivo, 1)
+                    self.conn.executemany(_INSERT_PARCELA_SQL, installment_rows(arquivo, df))
+                    inserted += len(rows)
+                meta = metadata or (df.iloc[0].to_dict() if rows else {})
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO faturas (arquivo, data_emissao, data_vencimento, valor_total_declarado,"
+                    " cartao_principal, nome_cliente, qtd_transacoes, ingerido_em, sha256, chave_cabecalho)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (arquivo, meta.get("data_emissao"), meta.get("data_vencimento"),
+                     meta.get("valor_total_declarado"), meta.get("cartao_principal"), meta.get("nome_cliente"),
+                     len(rows), now, meta.get("sha256"), meta.get("chave_cabecalho")),
+                )
+            self._writes += 1
+        logging.info(f"Store: {inserted} transações gravadas de {len(frames)} arquivo(s) em {self.db_path}")
+        return inserted
+
+    def load_dataframe(self, df: pd.DataFrame) -> int:
+        """Replaces every file present in a consolidated DataFrame (one transaction)."""
+        if df.empty:
+            return 0
+        return self.replace_files({arquivo: (group, None) for arquivo, group in df.groupby("arquivo", sort=False)})
+
+    def delete_file(self, arquivo: str):
+        with self._lock, self.conn:
+            self._apply_rollups(arquivo, -1)
+            self.conn.execute("DELETE FROM transacoes WHERE arquivo = ?", (arquivo,))
+            self.conn.execute("DELETE FROM parcelas WHERE arquivo = ?", (arquivo,))
+            self.conn.execute("DELETE FROM faturas WHERE arquivo = ?", (arquivo,))
+            self._writes += 1
+
+    def files(self) -> Iterable[str]:
+        with self._lock:
+            return [r[0] for r in self.conn.execute("SELECT arquivo FROM faturas ORDER BY arquivo")]
+
+    def find_invoice(self, sha256: Optional[str] = None, chave_cabecalho: Optional[str] = None) -> Optional[str]:
+        """arquivo of a stored invoice with the given content hash or header key, if any."""
+        column, value = ("sha256", sha256) if sha256 else ("chave_cabecalho", chave_cabecalho)
+        if not value:
+            return None
+        with self._lock:
+            row = self.conn.execute(f"SELECT arquivo FROM faturas WHERE {column} = ? LIMIT 1", (value,)).fetchone()
+        return row[0] if row else None
+
+    def invoice(self, arquivo: str) -> Optional[Dict]:
+        with self._lock:
+            cur = self.conn.execute("SELECT * FROM faturas WHERE arquivo = ?", (arquivo,))
+            row = cur.fetchone()
+            return dict(zip([d[0] for d in cur.description], row)) if row else None
+
+    def read_dataframe(self, arquivo: Optional[str] = None) -> pd.DataFrame:
+        sql = f"SELECT {', '.join(COLUMN_NAMES)} FROM transacoes"
+        params = ()
+        if arquivo is not None:
+            sql += " WHERE arquivo = ?"
+            params = (arquivo,)
+        with self._lock:
+            df = pd.read_sql_query(sql + " ORDER BY rowid", self.conn, params=params)
+        df["internacional"] = df["internacional"].fillna(0).astype(bool)
+        return df
+
+    def revision(self) -> str:
+        """
+        Changes whenever the data changes: own writes are counted here and PRAGMA data_version
+        moves when another connection (e.g. a run_etl process) commits. Used for HTTP ETags.
+        """
+        with self._lock:
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            return f"{self._instance}.{data_version}.{self._writes}"
+
+    @staticmethod
+    def _active_filters(filters: Optional[Dict]) -> Dict:
+        active = {k: v for k, v in (filters or {}).items() if v is not None}
+        unknown = set(active) - set(FILTERS)
+        if unknown:
+            raise ValueError(f"Filtro desconhecido: {', '.join(sorted(unknown))}")
+        return active
+
+    @staticmethod
+    def _rollup_for(dims, filters: Dict) -> Optional[str]:
+        """First rollup table able to answer the grouping + filters, or None (raw table)."""
+        for table, rollup_dims in ROLLUPS.items():
+            if not set(dims) <= set(rollup_dims):
+                continue
+            if all(FILTERS[f][1] and FILTERS[f][1][0] in rollup_dims for f in filters):
+                return table
+        return None
+
+    def aggregate(self, by: str, filters: Optional[Dict] = None, limit: int = 50, offset: int = 0):
+        """
+        Sum and count of transactions grouped by one of AGGREGATIONS, with pagination.
+        Reads the monthly rollup tables whenever they cover the grouping and filters and only
+        falls back to scanning transacoes for day-level or per-file filters.
+        Returns (items, total_groups).
+        """
+        if by not in AGGREGATIONS:
+            raise ValueError(f"Agrupamento desconhecido: {by}")
+        dims, order = AGGREGATIONS[by]
+        active = self._active_filters(filters)
+        table = self._rollup_for(dims, active)
+        if table:
+            select = ", ".join(f"NULLIF({d}, '') AS {d}" for d in dims)
+            group = ", ".join(dims)
+            clauses = [FILTERS[f][1][1] for f in active]
+            measures = "ROUND(SUM(total_centavos) / 100.0, 2) AS total, SUM(qtd) AS qtd"
+        else:
+            table = "transacoes"
+            select = ", ".join(f"{DIMENSIONS[d]} AS {d}" for d in dims)
+            group = ", ".join(DIMENSIONS[d] for d in dims)
+            clauses = [FILTERS[f][0] for f in active]
+            measures = "ROUND(SUM(valor), 2) AS total, COUNT(*) AS qtd"
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        params = list(active.values())
+        sql = f"SELECT {select}, {measures} FROM {table}{where} GROUP BY {group} ORDER BY {order} LIMIT ? OFFSET ?"
+        count_sql = f"SELECT COUNT(*) FROM (SELECT 1 FROM {table}{where} GROUP BY {group})"
+        with self._lock:
+            cur = self.conn.execute(sql, params + [limit, offset])
+            names = [d[0] for d in cur.description]
+            items = [dict(zip(names, row)) for row in cur.fetchall()]
+            total = self.conn.execute(count_sql, params).fetchone()[0]
+        return items, total
+
+    def installment_series(self, estabelecimento: str, data_compra: Optional[str], total_parcelas: int) -> List[Dict]:
+        """
+        Every stored installment of one purchase (a primary-key prefix lookup), ordered by number.
+        The stored purchase year is anchored to the invoices (see anchor_purchase_year), so a
+        data_compra one year off (as inferred from a single invoice) is tried next.
+        """
+        candidates = [data_compra]
+        if data_compra and re.match(r"\d{4}-", data_compra):
+            year = int(data_compra[:4])
+            candidates += [f"{y:04d}{data_compra[4:]}" for y in (year - 1, year + 1)]
+        with self._lock:
+            for candidate in candidates:
+                cur = self.conn.execute(
+                    "SELECT numero, arquivo, final_cartao, mes_fatura, valor_centavos / 100.0 AS valor"
+                    " FROM parcelas WHERE chave = ? ORDER BY numero, arquivo",
+                    (installment_key(estabelecimento, candidate, total_parcelas),),
+                )
+                names = [d[0] for d in cur.description]
+                rows = [dict(zip(names, row)) for row in cur.fetchall()]
+                if rows:
+                    return rows
+        return []
+
+    def duplicate_installments(self, limit: int = 50, offset: int = 0):
+        """Installments (same series and number) billed by more than one invoice. Returns (items, total)."""
+        base = (
+            "SELECT chave, estabelecimento, data_compra, total_parcelas, numero,"
+            " COUNT(DISTINCT arquivo) AS qtd_faturas, GROUP_CONCAT(DISTINCT arquivo) AS arquivos"
+            " FROM parcelas GROUP BY chave, numero HAVING COUNT(DISTINCT arquivo) > 1"
+        )
+        with self._lock:
+            cur = self.conn.execute(base + " ORDER BY chave, numero LIMIT ? OFFSET ?", (limit, offset))
+            names = [d[0] for d in cur.description]
+            items = [dict(zip(names, row)) for row in cur.fetchall()]
+            total = self.conn.execute(f"SELECT COUNT(*) FROM ({base})").fetchone()[0]
+        for item in items:
+            item["arquivos"] = item["arquivos"].split(",")
+        return items, total
+
+    def projected_installments(self, a_partir: Optional[str] = None) -> List[Dict]:
+        """Future installment outflows per month, from the latest installment seen of each series."""
+        with self._lock:
+            # Colunas "soltas" com MAX(): o SQLite as lê da linha que tem o máximo
+            last_seen = self.conn.execute(
+                "SELECT MAX(numero), total_parcelas, mes_fatura, valor_centavos FROM parcelas GROUP BY chave"
+            ).fetchall()
+        return project_outflows(last_seen, a_partir)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,328 @@
+import os
+import random
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+
+# Gerador de faturas sintéticas no layout Itaú (duas colunas, blocos "final dddd",
+# seção internacional, parcelas e páginas de resumo). Usado pelo benchmark e como
+# fixture reprodutível, sem depender de PDFs reais de clientes.
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+FONT_SIZE = 8
+LEADING = 11
+TOP_Y = 800
+BOTTOM_Y = 40
+COLUMNS_X = (36, 372)
+AMOUNT_OFFSET = 185
+# Descrições são truncadas como no layout real, para não invadir a coluna de valores
+MAX_DESC_LEN = 22
+
+HOLDERS = ["JOAO P SILVA", "MARIA C SOUZA", "ANA L PEREIRA", "CARLOS E LIMA", "BEATRIZ M COSTA", "PEDRO H ALVES"]
+
+MERCHANTS = [
+    "UBER* TRIP", "99APP *99APP", "METRORJ", "POSTO SHELL BARRA", "IFD*IFOOD CLUB", "RAPPI BRASIL",
+    "PAO DE ACUCAR 1234", "MUNDIAL SUPERMERCADO", "PADARIA ROMA", "OUTBACK BARRA", "DROGARIA RAIA",
+    "DROGARIA PACHECO", "WELLHUB GYMPASS", "NETFLIX.COM", "SPOTIFY", "CLARO MOVEL", "AMAZON BR",
+    "MERCADO LIVRE", "SHOPEE", "RENNER LOJA 45", "DECATHLON", "HOTEL IBIS CENTRO", "LATAM AIR",
+    "LIVRARIA CULTURA", "OTICA CENTRAL", "ESTACIONAMENTO CENTRO", "ZIG*CASA ARRAIA", "LANCHES NECTAR",
+]
+
+INSTALLMENT_MERCHANTS = ["MAGALU", "FAST SHOP", "CASAS BAHIA", "MLP *KABUM", "DECATHLON", "VIVARA", "AZUL LINHAS"]
+
+INTERNATIONAL_MERCHANTS = ["AMAZON WEB SERVICES", "STEAM PURCHASE", "OPENAI SUBSCR", "APPLE.COM/BILL", "GITHUB INC", "BOOKING.COM"]
+
+
+def format_money(cents: int) -> str:
+    """Formats integer cents as a PT-BR amount (e.g. 123456 -> '1.234,56')."""
+    sign = "-" if cents < 0 else ""
+    cents = abs(cents)
+    inteiro = f"{cents // 100:,}".replace(",", ".")
+    return f"{sign}{inteiro},{cents % 100:02d}"
+
+
+def _pdf_escape(text: str) -> bytes:
+    escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return escaped.encode("cp1252", errors="replace")
+
+
+def write_pdf(path: str, pages: List[List[Tuple[float, float, str]]], font_size: int = FONT_SIZE) -> None:
+    """
+    Writes a minimal PDF where each page is a list of (x, y, text) items drawn in Helvetica.
+    Kept dependency-free so the benchmark corpus can be generated on any machine.
+    """
+    objects = []
+    page_ids = []
+    # 1: catalog, 2: pages, 3: font; pages and contents follow
+    next_id = 4
+    for items in pages:
+        stream = b"".join(
+            b"BT /F1 %d Tf 1 0 0 1 %.2f %.2f Tm (" % (font_size, x, y) + _pdf_escape(text) + b") Tj ET\n"
+            for x, y, text in items
+        )
+        page_id, content_id = next_id, next_id + 1
+        next_id += 2
+        page_ids.append(page_id)
+        objects.append((page_id, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (PAGE_WIDTH, PAGE_HEIGHT, content_id)))
+        objects.append((content_id, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"endstream"))
+
+    kids = b" ".join(b"%d 0 R" % pid for pid in page_ids)
+    objects = [
+        (1, b"<< /Type /Catalog /Pages 2 0 R >>"),
+        (2, b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)),
+        (3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"),
+    ] + objects
+    write_pdf_objects(path, objects)
+
+
+def write_pdf_objects(path: str, objects: List[Tuple[int, bytes]]) -> None:
+    """Writes numbered PDF objects (1 must be the catalog) with their xref table and trailer."""
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id, body in objects:
+        offsets[obj_id] = len(out)
+        out += b"%d 0 obj\n" % obj_id + body + b"\nendobj\n"
+    xref_pos = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for obj_id in range(1, len(objects) + 1):
+        out += b"%010d 00000 n \n" % offsets[obj_id]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_pos)
+
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+class _ColumnFlow:
+    """Lays out lines top-to-bottom, left column first, breaking into new pages as needed."""
+
+    def __init__(self, columns_x=COLUMNS_X, amount_offset=AMOUNT_OFFSET):
+        self.columns_x = tuple(columns_x)
+        self.amount_offset = amount_offset
+        self.pages = [[]]
+        self.column = 0
+        self.y = TOP_Y
+
+    def _advance(self):
+        self.y -= LEADING
+        if self.y < BOTTOM_Y:
+            self.y = TOP_Y
+            self.column += 1
+            if self.column >= len(self.columns_x):
+                self.column = 0
+                self.pages.append([])
+
+    def line(self, text: str, amount: str = None):
+        x = self.columns_x[self.column]
+        self.pages[-1].append((x, self.y, text))
+        if amount is not None:
+            self.pages[-1].append((x + self.amount_offset, self.y, amount))
+        self._advance()
+
+    def new_page(self):
+        if self.pages[-1]:
+            self.pages.append([])
+        self.column = 0
+        self.y = TOP_Y
+
+
+def build_invoice(
+    seed: int = 0,
+    cards: int = 3,
+    transactions_per_card: int = 40,
+    international: bool = True,
+    installments: bool = True,
+    summary_pages: int = 1,
+    columns_x: Tuple[float, ...] = COLUMNS_X,
+    amount_offset: float = AMOUNT_OFFSET,
+) -> Dict:
+    """
+    Builds the page layout of a synthetic Itaú invoice.
+
+    columns_x / amount_offset move the text columns and the amount column, to produce
+    layouts whose gutter is not the usual one (a single x in columns_x gives one column).
+
+    Returns a dict with 'pages' (ready for write_pdf) and the expected values
+    ('valor_total_declarado', 'transacoes', 'cartoes', 'vencimento', 'emissao').
+    """
+    rng = random.Random(seed)
+    emissao = date(2025, 1, 20) + timedelta(days=30 * rng.randint(0, 11))
+    vencimento = emissao + timedelta(days=7)
+    holders = rng.sample(HOLDERS, k=min(cards, len(HOLDERS)))
+    while len(holders) < cards:
+        holders.append(f"{rng.choice(HOLDERS)} {len(holders)}")
+    finals = [f"{rng.randint(1000, 9999)}" for _ in range(cards)]
+    principal = f"4771.XXXX.XXXX.{finals[0]}"
+
+    def random_date():
+        return emissao - timedelta(days=rng.randint(1, 35))
+
+    blocks = []
+    total_cents = 0
+    n_transactions = 0
+    for holder, final in zip(holders, finals):
+        rows = []
+        for _ in range(transactions_per_card):
+            dt = random_date()
+            if installments and rng.random() < 0.15:
+                total_parc = rng.randint(2, 12)
+                desc = f"{rng.choice(INSTALLMENT_MERCHANTS)} {rng.randint(1, total_parc):02d}/{total_parc:02d}"
+            else:
+                desc = rng.choice(MERCHANTS)
+            cents = rng.randint(500, 60000)
+            if rng.random() < 0.03:
+                cents = -cents // 4
+                desc = ("ESTORNO " + desc)[:MAX_DESC_LEN]
+            rows.append((dt, desc, cents))
+        rows.sort(key=lambda r: r[0])
+        subtotal = sum(r[2] for r in rows)
+        blocks.append((holder, final, rows, subtotal))
+        total_cents += subtotal
+        n_transactions += len(rows)
+
+    intl_rows = []
+    iof_cents = 0
+    if international:
+        for _ in range(max(2, transactions_per_card // 8)):
+            intl_rows.append((random_date(), rng.choice(INTERNATIONAL_MERCHANTS), rng.randint(1000, 40000)))
+        intl_rows.sort(key=lambda r: r[0])
+        iof_cents = round(sum(r[2] for r in intl_rows) * 0.0438)
+        total_cents += sum(r[2] for r in intl_rows) + iof_cents
+        n_transactions += len(intl_rows) + 1
+
+    flow = _ColumnFlow(columns_x, amount_offset)
+
+    # Página 1: cabeçalho (coluna esquerda) e resumo (coluna direita)
+    flow.line("Olá, " + holders[0].title())
+    flow.line(f"Titular {holders[0]}")
+    flow.line(f"Cartão {principal}")
+    flow.line(f"Vencimento: {vencimento.strftime('%d/%m/%Y')}")
+    flow.line(f"Emissão: {emissao.strftime('%d/%m/%Y')}")
+    flow.line("Total desta fatura", format_money(total_cents))
+    if len(columns_x) > 1:
+        flow.column, flow.y = 1, TOP_Y
+    flow.line("Resumo da fatura")
+    flow.line("Compras nacionais", format_money(sum(b[3] for b in blocks)))
+    if international:
+        flow.line("Compras internacionais", format_money(total_cents - sum(b[3] for b in blocks)))
+    flow.line("Pagamento mínimo", format_money(total_cents // 7))
+    flow.line("Limites de crédito")
+    flow.line("Limite total", format_money(2500000))
+
+    # Páginas de lançamentos
+    flow.new_page()
+    flow.line("Lançamentos: compras e saques")
+    for holder, final, rows, subtotal in blocks:
+        flow.line(f"{holder} (final {final})")
+        for dt, desc, cents in rows:
+            flow.line(f"{dt.strftime('%d/%m')} {desc[:MAX_DESC_LEN]}", format_money(cents))
+        flow.line(f"Lançamentos no cartão (final {final})", format_money(subtotal))
+        if rng.random() < 0.5:
+            pay_dt = emissao - timedelta(days=rng.randint(20, 30))
+            flow.line(f"{pay_dt.strftime('%d/%m')} PAGAMENTO DEBITO AUT", format_money(-rng.randint(10000, 90000)))
+
+    if international:
+        flow.line("Lançamentos internacionais")
+        flow.line(f"{holders[0]} (final {finals[0]})")
+        for dt, desc, cents in intl_rows:
+            flow.line(f"{dt.strftime('%d/%m')} {desc}", format_money(cents))
+        flow.line("Repasse de IOF em R$", format_money(iof_cents))
+
+    flow.line("Total dos lançamentos atuais", format_money(total_cents))
+
+    if installments:
+        flow.line("Compras parceladas - próximas faturas")
+        for holder, final, rows, _ in blocks:
+            for dt, desc, cents in rows:
+                if "/" in desc.split()[-1]:
+                    flow.line(f"{dt.strftime('%d/%m')} {desc}", format_money(cents))
+
+    for _ in range(summary_pages):
+        flow.new_page()
+        flow.line("Simulação de parcelamento")
+        for n in range(2, 13):
+            flow.line(f"{n} parcelas de", format_money(total_cents // n + total_cents // 40))
+        flow.line("Preparamos outras opções de pagamento")
+        flow.line("Encargos cobrados nesta fatura")
+        flow.line("Juros do rotativo 14,50% a.m.")
+
+    return {
+        "pages": flow.pages,
+        "valor_total_declarado": total_cents / 100,
+        "transacoes": n_transactions,
+        "cartoes": finals,
+        "vencimento": vencimento.strftime("%d/%m/%Y"),
+        "emissao": emissao.strftime("%d/%m/%Y"),
+    }
+
+
+def build_generic_invoice(seed: int = 0, transactions: int = 60, **_ignored) -> Dict:
+    """
+    Builds a single-column, non-Itaú invoice (date, description and amount per line),
+    used to exercise the generic extractor. Amounts sit past x=355, where the Itaú
+    two-column split would cut the line in half.
+    """
+    rng = random.Random(seed)
+    emissao = date(2025, 1, 20) + timedelta(days=30 * rng.randint(0, 11))
+    vencimento = emissao + timedelta(days=10)
+    holder = rng.choice(HOLDERS)
+    rows = sorted(
+        ((emissao - timedelta(days=rng.randint(1, 30)), rng.choice(MERCHANTS), rng.randint(500, 60000)) for _ in range(transactions)),
+        key=lambda r: r[0],
+    )
+    total_cents = sum(r[2] for r in rows)
+
+    pages = [[]]
+    y = TOP_Y
+
+    def emit(text, amount=None):
+        nonlocal y
+        if y < BOTTOM_Y:
+            pages.append([])
+            y = TOP_Y
+        pages[-1].append((COLUMNS_X[0], y, text))
+        if amount is not None:
+            pages[-1].append((470, y, amount))
+        y -= LEADING
+
+    emit("Banco Exemplo S.A. - Fatura do cartão de crédito")
+    emit(f"Olá, {holder.title()}")
+    emit(f"Valor total R$ {format_money(total_cents)}")
+    emit(f"Vencimento: {vencimento.strftime('%d/%m/%Y')}")
+    emit("Data Descrição Valor (R$)")
+    for dt, desc, cents in rows:
+        emit(f"{dt.strftime('%d/%m')} {desc}", format_money(cents))
+
+    return {
+        "pages": pages,
+        "valor_total_declarado": total_cents / 100,
+        "transacoes": len(rows),
+        "cartoes": ["XXXX"],
+        "vencimento": vencimento.strftime("%d/%m/%Y"),
+        "emissao": None,
+    }
+
+
+LAYOUTS = {"itau": build_invoice, "generic": build_generic_invoice}
+
+
+def generate_invoice(path: str, layout: str = "itau", **kwargs) -> Dict:
+    """Writes a synthetic invoice PDF to `path` and returns its expected values (see build_invoice)."""
+    invoice = LAYOUTS[layout](**kwargs)
+    write_pdf(path, invoice["pages"])
+    pages = invoice.pop("pages")
+    return {"arquivo": os.path.basename(path), "paginas": len(pages), **invoice}
+
+
+def generate_corpus(output_dir: str, n_files: int = 10, seed: int = 0, layout: str = "itau", **kwargs) -> List[Dict]:
+    """
+    Generates `n_files` synthetic invoices in `output_dir`, deterministically from `seed`.
+    `layout` is "itau" or "generic"; extra keyword arguments are forwarded to the layout
+    builder (cards, transactions_per_card, ...).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    prefix = "Fatura_Itau_sintetica" if layout == "itau" else "Fatura_Generica_sintetica"
+    manifest = []
+    for i in range(n_files):
+        path = os.path.join(output_dir, f"{prefix}_{seed:04d}_{i:04d}.pdf")
+        manifest.append({"caminho": path, **generate_invoice(path, layout=layout, seed=seed * 100003 + i, **kwargs)})
+    return manifest
@@ -0,0 +1,263 @@
+import ctypes
+import importlib
+import logging
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+import pdfplumber
+
+# Backends de extração de texto. O motor só conversa com a interface abaixo (documento
+# com .pages; páginas com largura/altura, texto bruto, limites x dos caracteres, texto por
+# linha e palavras), então a biblioteca que lê o PDF é escolhida por implantação
+# (ETL_TEXT_BACKEND) sem mexer nos parsers:
+# - "pdfplumber": referência (pdfminer, Python puro); é o padrão
+# - "pdfium": pypdfium2 (PDFium nativo), já instalado como dependência do pdfplumber; lê
+#   os caracteres e suas caixas direto da camada de texto e monta linhas e palavras com
+#   as mesmas regras do pdfplumber (x_tolerance/y_tolerance = 3)
+# A conformidade entre os dois (linha a linha) e a vazão são medidas por
+# run_backend_conformance.py.
+
+DEFAULT_BACKEND = "pdfplumber"
+X_TOLERANCE = 3
+Y_TOLERANCE = 3
+
+
+class PlumberPage:
+    """A pdfplumber page behind the backend page interface (the reference behaviour)."""
+
+    def __init__(self, page):
+        self.page = page
+        self.width = float(page.width)
+        self.height = float(page.height)
+
+    def raw_text(self) -> str:
+        """Characters in content-stream order, no layout (used by the layout fingerprint)."""
+        return "".join(c["text"] for c in self.page.chars)
+
+    def x_bounds(self):
+        """(x0, x1) arrays of every character, for the column split detection."""
+        chars = self.page.chars
+        x0 = np.fromiter((c["x0"] for c in chars), dtype=float, count=len(chars))
+        x1 = np.fromiter((c["x1"] for c in chars), dtype=float, count=len(chars))
+        return x0, x1
+
+    def extract_text(self, split_x: Optional[float] = None) -> str:
+        """Page text line by line; with split_x the left column is read first, then the right one."""
+        if split_x is None:
+            return self.page.extract_text(x_tolerance=X_TOLERANCE) or ""
+        left = self.page.crop((0, 0, split_x, self.height)).extract_text(x_tolerance=X_TOLERANCE) or ""
+        right = self.page.crop((split_x, 0, self.width, self.height)).extract_text(x_tolerance=X_TOLERANCE) or ""
+        return left + "\n" + right
+
+    def extract_words(self) -> List[Dict]:
+        return self.page.extract_words(x_tolerance=X_TOLERANCE)
+
+
+class PdfiumPage:
+    """
+    A pypdfium2 page behind the backend page interface.
+
+    Characters (text, loose box) are read once from PDFium's text page into NumPy
+    arrays; lines are clustered by top and words split at blanks or x gaps like
+    pdfplumber's extract_text/extract_words with the same tolerances.
+    """
+
+    def __init__(self, page, pdfium_c):
+        self.page = page
+        self._c = pdfium_c
+        width, height = page.get_size()
+        self.width = float(width)
+        self.height = float(height)
+        self._chars = None
+
+    def _load(self):
+        if self._chars is None:
+            c = self._c
+            textpage = self.page.get_textpage()
+            try:
+                raw = textpage.raw
+                n = c.FPDFText_CountChars(raw)
+                texts, boxes = [], []
+                rect = c.FS_RECTF()
+                for i in range(n):
+                    # Quebras de linha e espaços gerados pelo PDFium não existem no conteúdo
+                    if c.FPDFText_IsGenerated(raw, i) == 1:
+                        continue
+                    ch = chr(c.FPDFText_GetUnicode(raw, i))
+                    if ch in "\r\n\x00" or not c.FPDFText_GetLooseCharBox(raw, i, ctypes.byref(rect)):
+                        continue
+                    texts.append(ch)
+                    boxes.append((rect.left, rect.right, self.height - rect.top, self.height - rect.bottom))
+            finally:
+                textpage.close()
+            box = np.array(boxes, dtype=float).reshape(-1, 4)
+            self._chars = (texts, box[:, 0], box[:, 1], box[:, 2], box[:, 3])
+        return self._chars
+
+    def raw_text(self) -> str:
+        return "".join(self._load()[0])
+
+    def x_bounds(self):
+        _, x0, x1, _, _ = self._load()
+        return x0, x1
+
+    def _words(self, select=None) -> List[Dict]:
+        """pdfplumber-style words (text, x0, x1, top, bottom) of the selected characters, in reading order."""
+        texts, x0, x1, top, bottom = self._load()
+        idx = np.arange(len(texts)) if select is None else np.flatnonzero(select)
+        if idx.size == 0:
+            return []
+        # Linhas: tops ordenados, nova linha quando o salto passa da tolerância (cluster_list do pdfplumber)
+        tops = np.unique(top[idx])
+        line_of_top = np.concatenate(([0], np.cumsum(np.diff(tops) > Y_TOLERANCE)))
+        line = line_of_top[np.searchsorted(tops, top[idx])]
+        idx = idx[np.lexsort((x0[idx], line))]
+        line = line_of_top[np.searchsorted(tops, top[idx])]
+
+        x0_, x1_, top_, bottom_ = x0.tolist(), x1.tolist(), top.tolist(), bottom.tolist()
+        words, current, prev = [], [], None
+        prev_line = -1
+
+        def flush():
+            if current:
+                words.append({
+                    "text": "".join(texts[j] for j in current),
+                    "x0": x0_[current[0]], "x1": x1_[current[-1]],
+                    "top": min(top_[j] for j in current), "bottom": max(bottom_[j] for j in current),
+                    "line": prev_line,
+                })
+
+        for j, ln in zip(idx.tolist(), line.tolist()):
+            if texts[j].isspace():
+                flush()
+                current, prev = [], None
+            elif prev is None or ln != prev_line or x0_[j] > x1_[prev] + X_TOLERANCE:
+                flush()
+                current, prev = [j], j
+            else:
+                current.append(j)
+                prev = j
+            prev_line = ln
+        flush()
+        return words
+
+    def extract_text(self, split_x: Optional[float] = None) -> str:
+        if split_x is None:
+            return self._lines(self._words())
+        _, x0, x1, _, _ = self._load()
+        # Como o crop do pdfplumber: um caractere que cruza a divisão entra nas duas colunas
+        return self._lines(self._words(x0 < split_x)) + "\n" + self._lines(self._words(x1 > split_x))
+
+    @staticmethod
+    def _lines(words) -> str:
+        lines, last = [], None
+        for w in words:
+            if w["line"] != last:
+                lines.append([])
+                last = w["line"]
+            lines[-1].append(w["text"])
+        return "\n".join(" ".join(ws) for ws in lines)
+
+    def extract_words(self) -> List[Dict]:
+        words = self._words()
+        for w in words:
+            del w["line"]
+        return words
+
+
+class _Document:
+    """Open document: .pages in the backend interface; close() or use as a context manager."""
+
+    def __init__(self, pages, closer, pdf_path):
+        self.pages = pages
+        self._closer = closer
+        self._pdf_path = pdf_path
+        self._plumber = None
+
+    @property
+    def plumber_pages(self):
+        """pdfplumber pages of the same file (OCR content hashes); opened only when asked."""
+        if not self.pages or isinstance(self.pages[0], PlumberPage):
+            return [p.page for p in self.pages]
+        if self._plumber is None:
+            self._plumber = pdfplumber.open(self._pdf_path)
+        return self._plumber.pages
+
+    def close(self):
+        if self._plumber is not None:
+            self._plumber.close()
+            self._plumber = None
+        self._closer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TextBackend:
+    """A PDF text engine; open(pdf_path) returns a document whose pages follow the interface above."""
+
+    name = "base"
+
+    def open(self, pdf_path: str) -> _Document:
+        raise NotImplementedError
+
+
+class PdfplumberBackend(TextBackend):
+    name = "pdfplumber"
+
+    def open(self, pdf_path: str) -> _Document:
+        pdf = pdfplumber.open(pdf_path)
+        return _Document([PlumberPage(p) for p in pdf.pages], pdf.close, pdf_path)
+
+
+class PdfiumBackend(TextBackend):
+    name = "pdfium"
+
+    def __init__(self):
+        try:
+            self._pdfium = importlib.import_module("pypdfium2")
+            self._c = importlib.import_module("pypdfium2.raw")
+        except ImportError as e:
+            raise RuntimeError("Backend pdfium requer o pacote pypdfium2 (pip install pypdfium2)") from e
+
+    def open(self, pdf_path: str) -> _Document:
+        pdf = self._pdfium.PdfDocument(pdf_path)
+        pages = [PdfiumPage(pdf[i], self._c) for i in range(len(pdf))]
+
+        def close():
+            for p in pages:
+                p.page.close()
+            pdf.close()
+
+        return _Document(pages, close, pdf_path)
+
+
+BACKENDS = {
+    PdfplumberBackend.name: PdfplumberBackend,
+    PdfiumBackend.name: PdfiumBackend,
+}
+
+
+def get_backend(name: Optional[str] = None) -> TextBackend:
+    """Backend by name; None reads ETL_TEXT_BACKEND (default pdfplumber)."""
+    name = name or os.getenv("ETL_TEXT_BACKEND", DEFAULT_BACKEND)
+    if name not in BACKENDS:
+        raise ValueError(f"Backend de extração desconhecido: {name} (opções: {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
+
+
+def available_backends() -> List[str]:
+    """Backends whose libraries can be loaded here."""
+    names = []
+    for name in BACKENDS:
+        try:
+            get_backend(name)
+        except RuntimeError as e:
+            logging.info(f"Backend {name} indisponível: {e}")
+            continue
+        names.append(name)
+    return names
@@ -0,0 +1,155 @@
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# Modo de extração por palavras/coordenadas: em vez de achatar a página com extract_text
+# e remontar a tabela com regex, cada página chama extract_words uma vez, as palavras são
+# agrupadas em linhas pelo "top" e cada linha é cortada em células nos espaços largos
+# (limiar adaptativo por página, calculado com NumPy). Data, descrição e valor saem direto
+# das células; só as linhas que não se encaixam nesse formato voltam para os regexes.
+
+# Mesma tolerância vertical do extract_text do pdfplumber
+ROW_TOLERANCE = 3
+# Um espaço de coluna é pelo menos esta fração maior que o espaço entre palavras
+MIN_COLUMN_GAP_FACTOR = 2.0
+
+DATE_RE = re.compile(r'\d{2}/\d{2}')
+AMOUNT_RE = re.compile(r'-\s*(?:\d{1,3}(?:\.\d{3})*|\d+),\d{2}|(?:\d{1,3}(?:\.\d{3})*|\d+),\d{2}')
+# Lançamentos sem data (tarifas e IOF avulsos)
+UNDATED_ENTRY_WORDS = ("IOF", "TAR")
+
+
+class WordEntry(NamedTuple):
+    """
+    One transaction read from the cells of a row.
+
+    - start: offset of its first word in the row text (orders it against card headers)
+    - groups: (date, description, amount) or, for undated entries, (description, amount),
+      the same groups TRANSACTION_RE / IOF_TAR_RE capture
+    - text: the entry as it appears in the row text
+    """
+
+    start: int
+    has_date: bool
+    groups: Tuple[str, ...]
+    text: str
+
+
+class WordPageText(str):
+    """
+    Page text rebuilt from extract_words rows, one row per line.
+
+    entries[i] holds the transactions already read from line i ([] when the line has
+    none) or None when the line did not fit the cell layout and must go through the
+    regexes. Any string operation returns a plain str, so text changed afterwards
+    (e.g. merged with OCR) naturally loses the entries.
+    """
+
+    entries: List[Optional[List[WordEntry]]]
+
+    def __new__(cls, lines: List[str], entries: List[Optional[List[WordEntry]]]):
+        page = super().__new__(cls, "\n".join(lines))
+        page.entries = entries
+        return page
+
+    def __reduce__(self):
+        return (WordPageText, (self.split("\n"), self.entries))
+
+
+def column_gap_threshold(gaps: np.ndarray, heights: np.ndarray) -> float:
+    """
+    Gap (in points) above which two words of the same row belong to different cells.
+
+    The typical word space is the median of the gaps narrower than the font height;
+    the threshold sits halfway between the widest space-like gap and the narrowest gap
+    clearly wider than a space. inf when the page has no wide gaps at all.
+    """
+    if gaps.size == 0:
+        return float("inf")
+    height = float(np.median(heights)) if heights.size else 8.0
+    spaces = gaps[gaps < height]
+    space = float(np.median(spaces)) if spaces.size else height / 4
+    limit = max(space, 0.5) * MIN_COLUMN_GAP_FACTOR
+    wide = gaps[gaps > limit]
+    if wide.size == 0:
+        return float("inf")
+    narrow = gaps[gaps <= limit]
+    return (float(narrow.max()) + float(wide.min())) / 2 if narrow.size else float(wide.min()) - 0.01
+
+
+def _rows(words):
+    """Words grouped in rows (top to bottom), each row sorted left to right."""
+    if not words:
+        return []
+    top = np.fromiter((w["top"] for w in words), dtype=float, count=len(words))
+    x0 = np.fromiter((w["x0"] for w in words), dtype=float, count=len(words))
+    by_top = np.argsort(top, kind="stable")
+    row_of = np.empty(len(words), dtype=np.int64)
+    row_of[by_top] = np.concatenate(([0], np.cumsum(np.diff(top[by_top]) > ROW_TOLERANCE)))
+    order = np.lexsort((x0, row_of))
+    breaks = np.flatnonzero(np.diff(row_of[order])) + 1
+    return [[words[i] for i in chunk] for chunk in np.split(order, breaks)]
+
+
+def _row_entries(row, cell_breaks, offsets) -> Optional[List[WordEntry]]:
+    """Transactions of one row from its cells; None when the row needs the regex path."""
+    entries = []
+    open_words = None
+    for lo, hi in zip([0] + cell_breaks, cell_breaks + [len(row)]):
+        cell = [w["text"] for w in row[lo:hi]]
+        cell_text = " ".join(cell)
+        if open_words is not None and AMOUNT_RE.fullmatch(cell_text):
+            start, first = open_words
+            desc_words = [w["text"] for w in row[first:lo]]
+            text = " ".join(desc_words + cell)
+            if DATE_RE.fullmatch(desc_words[0]):
+                entries.append(WordEntry(start, True, (desc_words[0], " ".join(desc_words[1:]), cell_text), text))
+            else:
+                entries.append(WordEntry(start, False, (" ".join(desc_words), cell_text), text))
+            open_words = None
+        elif DATE_RE.fullmatch(cell[0]) or cell[0] in UNDATED_ENTRY_WORDS:
+            if open_words is not None:
+                # Data sem valor antes de outra data: formato inesperado
+                return None
+            open_words = (offsets[lo], lo)
+    if open_words is not None:
+        return None
+    return entries
+
+
+def page_text_from_words(words, split_x: Optional[float] = None) -> WordPageText:
+    """
+    Builds a WordPageText from the output of page.extract_words(). With split_x the
+    words left of it are read first (one column), then the ones right of it.
+    """
+    if split_x is not None:
+        columns = [[w for w in words if (w["x0"] + w["x1"]) / 2 < split_x],
+                   [w for w in words if (w["x0"] + w["x1"]) / 2 >= split_x]]
+    else:
+        columns = [words]
+    rows = [row for col in columns for row in _rows(col)]
+    row_gaps = [[b["x0"] - a["x1"] for a, b in zip(row, row[1:])] for row in rows]
+
+    # Limiar adaptativo: todos os espaços entre palavras vizinhas da página
+    threshold = column_gap_threshold(
+        np.fromiter((g for gaps in row_gaps for g in gaps), dtype=float),
+        np.fromiter((row[0]["bottom"] - row[0]["top"] for row in rows), dtype=float, count=len(rows)),
+    )
+
+    lines, entries = [], []
+    for row, gaps in zip(rows, row_gaps):
+        texts = [w["text"] for w in row]
+        line = " ".join(texts)
+        lines.append(line)
+        # "%" logo após um valor o descarta no caminho de regex; aqui a linha vai inteira para ele
+        if "%" in line:
+            entries.append(None)
+            continue
+        offsets, pos = [], 0
+        for t in texts:
+            offsets.append(pos)
+            pos += len(t) + 1
+        cell_breaks = [i + 1 for i, g in enumerate(gaps) if g > threshold]
+        entries.append(_row_entries(row, cell_breaks, offsets))
+    return WordPageText(lines, entries)